@@ -0,0 +1,250 @@
+"""Offline benchmark suite for the parsing / ratio pipeline.
+
+    python bench.py --rows 1000 10000 --years 3 10 --repeat 5 --out bench.json
+    python bench.py --stages api --rows 5000       # drives /analyze through a local TestClient, parsing in-process
+    python bench.py --stages pdf --pdf-pages 50    # needs matplotlib + pdfplumber
+    python bench.py --stages startup --rows 1000   # cold import + first /analyze in fresh interpreters
+    python bench.py --stages stress --scenarios 100000
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import tracemalloc
+from typing import Callable, Dict, List
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import numpy as np
+import pandas as pd
+from shared.parsing import (parse_financials, parse_financials_multi, wide_to_long, compute_ratios,
+                            compute_ratios_frame, clean_values, LABEL_CACHE)
+
+SYNONYMS = {
+    'Revenue': ["Revenue", "Net Sales", "Total revenue", "Sales", "Turnover"],
+    'COGS': ["Cost of goods sold", "COGS", "Cost of revenue"],
+    'Operating Expenses': ["Operating expenses", "Selling, general and administrative", "SGA", "Research and development"],
+    'EBIT': ["Operating income", "EBIT", "Earnings before interest and taxes"],
+    'Net Income': ["Net income", "Net profit", "Profit for the period"],
+    'Cash': ["Cash", "Cash and cash equivalents"],
+    'Accounts Receivable': ["Accounts receivable", "Trade receivables"],
+    'Inventory': ["Inventory", "Inventories", "Merchandise inventory"],
+    'Current Liabilities': ["Total current liabilities", "Current liabilities"],
+    'Equity': ["Total equity", "Shareholders' equity"],
+    'Total Assets': ["Total assets"],
+    'Interest Expense': ["Interest expense", "Finance costs"],
+    'CFO': ["Net cash provided by operating activities", "Cash flow from operations"],
+    'Principal Repayment': ["Repayments of borrowings", "Loan repayment"],
+}
+FILLER = ["Goodwill", "Deferred tax", "Prepaid expenses", "Other income", "Right-of-use assets",
+          "Provisions", "Share capital", "Dividends declared", "Depreciation", "Amortisation"]
+
+def _label(rng: random.Random, noise: float) -> str:
+    label = rng.choice(rng.choice(list(SYNONYMS.values()))) if rng.random() < 0.6 else rng.choice(FILLER)
+    label = f"{label} {rng.randint(1, 999)}" if rng.random() < 0.5 else label
+    if rng.random() < noise:
+        label = rng.choice([label.upper(), label.lower(), f"  {label}  ", label.replace(" ", "  ")])
+    return label
+
+def _value(rng: random.Random, noise: float):
+    v = rng.randint(-5_000_000, 5_000_000)
+    if rng.random() >= noise:
+        return v
+    r = rng.random()
+    if r < 0.4:
+        return f"{v:,}"
+    if r < 0.8:
+        return f"({abs(v):,})"
+    return rng.choice(["", "n/a", None])
+
+def synthetic_long(rows: int, noise: float = 0.3, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame({"Account": [_label(rng, noise) for _ in range(rows)],
+                         "Value": [_value(rng, noise) for _ in range(rows)]})
+
+def synthetic_wide(rows: int, years: int, noise: float = 0.3, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    out = {"Line Item": [_label(rng, noise) for _ in range(rows)]}
+    for y in range(2025 - years, 2025):
+        out[str(y)] = [_value(rng, noise) for _ in range(rows)]
+    return pd.DataFrame(out)
+
+def synthetic_pdf(pages: int, rows_per_page: int = 12, seed: int = 0) -> bytes:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_pdf import PdfPages
+    df = synthetic_long(pages * rows_per_page, noise=0.0, seed=seed)
+    buf = io.BytesIO()
+    with PdfPages(buf) as pdf:
+        for p in range(pages):
+            chunk = df.iloc[p * rows_per_page:(p + 1) * rows_per_page]
+            fig = Figure(figsize=(8.27, 11.69))
+            ax = fig.add_axes([0.1, 0.1, 0.8, 0.8]); ax.axis("off")
+            ax.table(cellText=[[a, f"{v:,}"] for a, v in zip(chunk["Account"], chunk["Value"])], loc="center")
+            pdf.savefig(fig)
+    return buf.getvalue()
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1, setup: Callable[[], object] = None) -> Dict[str, float]:
+    """Times fn; setup (e.g. clearing a cache) runs before every call, outside the timer."""
+    setup = setup or (lambda: None)
+    for _ in range(warmup):
+        setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"min_ms": round(min(times) * 1000, 3), "median_ms": round(statistics.median(times) * 1000, 3),
+            "peak_mem_mb": round(peak / 2**20, 3)}
+
+def _basics_frame(borrowers: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cols = list(parse_financials(synthetic_long(5))[0].keys())
+    data = rng.integers(-1_000, 2_000_000, size=(borrowers, len(cols))).astype(float)
+    data[rng.random(data.shape) < 0.1] = np.nan
+    return pd.DataFrame(data, columns=cols)
+
+_STARTUP_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+t1 = time.perf_counter()
+heavy = sorted(m for m in ("pandas", "numpy", "pdfplumber", "docx", "matplotlib", "openpyxl") if m in sys.modules)
+from fastapi.testclient import TestClient
+data = open(sys.argv[2], "rb").read()
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    client.post("/analyze", files={"file": ("bench.csv", data)}).raise_for_status()
+    t3 = time.perf_counter()
+    client.post("/analyze", files={"file": ("bench.csv", data + b"Bench row,1\\n")}).raise_for_status()
+    t4 = time.perf_counter()
+print(json.dumps({"import_main_ms": (t1 - t0) * 1000, "first_request_ms": (t3 - t2) * 1000,
+                  "second_request_ms": (t4 - t3) * 1000, "heavy_modules_at_import": heavy}))
+"""
+
+def startup(rows: int, repeat: int, seed: int) -> Dict:
+    """Import time of main and latency of the first and second /analyze, each run in a fresh interpreter."""
+    root = os.path.abspath(os.path.dirname(__file__))
+    env = {**os.environ, "CLEARPASS_CACHE_PATH": ""}
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as fh:
+        fh.write(synthetic_long(rows, seed=seed).to_csv(index=False).encode())
+    runs = []
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, root, fh.name], env=env,
+                                 capture_output=True, text=True, check=True)
+            res = json.loads(out.stdout.strip().splitlines()[-1])
+            res["process_ms"] = (time.perf_counter() - t0) * 1000
+            runs.append(res)
+    finally:
+        os.unlink(fh.name)
+    out = {k: round(statistics.median(r[k] for r in runs), 3) for k in ("import_main_ms", "first_request_ms", "second_request_ms", "process_ms")}
+    out["heavy_modules_at_import"] = runs[0]["heavy_modules_at_import"]
+    return out
+
+def run(stages: List[str], rows: List[int], years: List[int], noise: float, repeat: int,
+        cold: bool, pdf_pages: List[int], seed: int, scenarios: List[int] = ()) -> List[Dict]:
+    results = []
+    def record(stage, params, fn):
+        # Cold runs start every timed call from an empty label cache, so there is no warmup either.
+        timing = measure(fn, repeat, warmup=0, setup=LABEL_CACHE.clear) if cold else measure(fn, repeat)
+        res = {"stage": stage, **params, **timing}
+        results.append(res)
+        print(json.dumps(res), file=sys.stderr)
+    for n in rows:
+        if "startup" in stages:
+            res = {"stage": "startup", "rows": n, **startup(n, repeat, seed)}
+            results.append(res)
+            print(json.dumps(res), file=sys.stderr)
+        long_df = synthetic_long(n, noise, seed)
+        if "clean" in stages:
+            record("clean_values", {"rows": n}, lambda: clean_values(long_df["Value"]))
+        if "parse_long" in stages:
+            record("parse_financials", {"rows": n, "layout": "long"}, lambda: parse_financials(long_df))
+        if "ratios" in stages:
+            basics, _ = parse_financials(long_df)
+            record("compute_ratios", {"rows": 1}, lambda: compute_ratios(basics))
+            frame = _basics_frame(n, seed)
+            record("compute_ratios_frame", {"rows": n}, lambda: compute_ratios_frame(frame))
+        if "api" in stages:
+            from unittest import mock
+            from concurrent.futures import ThreadPoolExecutor
+            from fastapi.testclient import TestClient
+            import main
+            payload = long_df.to_csv(index=False).encode()
+            calls = itertools.count()
+            # Analyses run on a thread here instead of main's worker processes, so --cold's cache clear
+            # and peak_mem_mb reach the parsing; the process hop is covered by the startup stage.
+            with ThreadPoolExecutor(max_workers=1) as executor, mock.patch.object(main, "get_pool", lambda: executor), \
+                    TestClient(main.app) as client:
+                def call():
+                    # A unique trailing row keeps the result cache from short-circuiting the request.
+                    data = payload + f"Bench row {next(calls)},0\n".encode()
+                    client.post("/analyze", files={"file": ("bench.csv", data)}).raise_for_status()
+                record("api_analyze", {"rows": n}, call)
+        for y in years:
+            wide_df = synthetic_wide(n, y, noise, seed)
+            if "wide" in stages:
+                record("wide_to_long", {"rows": n, "years": y}, lambda: wide_to_long(wide_df))
+                record("parse_financials", {"rows": n, "years": y, "layout": "wide"}, lambda: parse_financials(wide_df))
+            if "multi" in stages:
+                record("parse_financials_multi", {"rows": n, "years": y}, lambda: parse_financials_multi(wide_df))
+    if "pdf" in stages:
+        from parser_pdf import extract_tables_to_long
+        for pages in pdf_pages:
+            data = synthetic_pdf(pages, seed=seed)
+            record("extract_tables_to_long", {"pages": pages}, lambda: extract_tables_to_long(io.BytesIO(data)))
+    if "stress" in stages:
+        import stress
+        from pipeline import jsonable
+        basics = jsonable(parse_financials(synthetic_long(1_000, noise, seed))[0])
+        spec = {"revenue": {"dist": "normal", "mean": -0.1, "sd": 0.1}, "rate_bp": {"dist": "uniform", "low": 0, "high": 400},
+                "ar_days": {"dist": "triangular", "low": 0, "mode": 15, "high": 60}}
+        for n in scenarios:
+            record("stress_monte_carlo", {"scenarios": n}, lambda: stress.monte_carlo(basics, spec, n, seed))
+    return results
+
+def environment() -> Dict[str, str]:
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "pandas": pd.__version__, "numpy": np.__version__, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+STAGES = ["clean", "parse_long", "wide", "multi", "ratios", "api", "pdf", "startup", "stress"]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the ClearPass parsing/ratio pipeline on synthetic statements.")
+    ap.add_argument("--stages", nargs="+", default=["clean", "parse_long", "wide", "multi", "ratios"], choices=STAGES)
+    ap.add_argument("--rows", nargs="+", type=int, default=[100, 1_000, 10_000])
+    ap.add_argument("--years", nargs="+", type=int, default=[3, 10])
+    ap.add_argument("--noise", type=float, default=0.3, help="share of labels/values given formatting noise")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--cold", action="store_true", help="clear the label cache before every timed call (and skip warmup)")
+    ap.add_argument("--pdf-pages", nargs="+", type=int, default=[10, 50])
+    ap.add_argument("--scenarios", nargs="+", type=int, default=[10_000, 100_000], help="Monte Carlo sizes for the stress stage")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write results JSON here (default stdout)")
+    args = ap.parse_args(argv)
+    report = {"environment": environment(), "args": vars(args),
+              "results": run(args.stages, args.rows, args.years, args.noise, args.repeat, args.cold, args.pdf_pages, args.seed, args.scenarios)}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
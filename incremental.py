@@ -0,0 +1,161 @@
+import math
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+import pandas as pd
+from shared.parsing import (ExactSum, classifier_for, default_keywords, norm, basics_from_agg, compute_ratios,
+                            normalize_numbers, _to_long, RATIO_INPUTS, set_stage_hook, reset_stage_hook)
+from metrics import StageRecorder
+
+def _same(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+def statement_lines(df: pd.DataFrame, decimal: str = "auto", scale: float = 1.0) -> Tuple[Dict[Tuple[str, int], Tuple[str, float]], Dict]:
+    """Keys a statement's rows by (normalized label, occurrence), the way an amended version lines up with
+    the original. Returns ({key: (account, value)}, unparseable report)."""
+    recorder = StageRecorder()
+    token = set_stage_hook(recorder)
+    try:
+        long = _to_long(df.copy().dropna(how="all"), decimal, scale)
+    finally:
+        reset_stage_hook(token)
+    seen: Dict[str, int] = {}
+    lines = {}
+    for account, value in zip(long["Account"].tolist(), long["Value"].tolist()):
+        label = norm(account)
+        n = seen.get(label, 0)
+        seen[label] = n + 1
+        lines[(label, n)] = (account, value)
+    return lines, recorder.unparseable_report()
+
+def compare_ratios(old: Dict, new: Dict) -> Dict[str, Dict]:
+    """Ratios whose value moved between two compute_ratios results, with old/new/change."""
+    out = {}
+    for k in dict.fromkeys(list(old) + list(new)):
+        a, b = old.get(k), new.get(k)
+        if not _same(a, b):
+            out[k] = {"old": a, "new": b, "change": None if a is None or b is None else round(b - a, 2)}
+    return out
+
+class IncrementalAnalysis:
+    """parse_financials state kept per line, so amending a statement costs time proportional to the change.
+
+    Each source (an uploaded statement) contributes lines keyed as in statement_lines; category totals are
+    exact running sums, so after any sequence of updates agg/basics/ratios equal a fresh parse of the
+    current lines. Ratios are recomputed only when one of their inputs (RATIO_INPUTS) moved.
+    """
+
+    def __init__(self, kw_map: Dict[str, List[str]] = None, decimal: str = "auto", scale: float = 1.0):
+        self.clf = classifier_for(default_keywords() if kw_map is None else kw_map)
+        self.decimal = decimal
+        self.scale = scale
+        self.sources: Dict[str, Dict] = {}
+        self._next: Dict[str, Dict[str, int]] = {}
+        self.unparseable: Dict[str, Dict] = {}
+        self._sums = [ExactSum() for _ in self.clf.categories]
+        self.agg = {k: 0.0 for k in self.clf.categories}
+        self.basics = basics_from_agg(self.agg)
+        self.ratios = compute_ratios(self.basics)
+
+    def _categories(self, label: str) -> Tuple[int, ...]:
+        return tuple(np.flatnonzero(self.clf.tag_normalized(label)).tolist())
+
+    def _contribute(self, label: str, value: float, sign: float, touched: set):
+        if value is None or math.isnan(value) or not value:
+            return
+        for k in self._categories(label):
+            self._sums[k].add(sign * value)
+            touched.add(k)
+
+    def _refresh(self, touched: set) -> Dict:
+        for k in touched:
+            self.agg[self.clf.categories[k]] = self._sums[k].value
+        old_basics, old_ratios = self.basics, self.ratios
+        basics = basics_from_agg(self.agg)
+        moved = {k for k, v in basics.items() if not _same(v, old_basics.get(k))}
+        affected = [r for r, inputs in RATIO_INPUTS.items() if moved & inputs]
+        self.basics = basics
+        if affected:
+            fresh = compute_ratios(basics)
+            self.ratios = {**old_ratios, **{r: fresh[r] for r in affected}}
+        return {"categories": sorted(self.clf.categories[k] for k in touched),
+                "basics": {k: {"old": old_basics.get(k), "new": basics[k]} for k in moved},
+                "ratios": compare_ratios(old_ratios, self.ratios)}
+
+    def apply(self, source: str, added: Iterable[Tuple[str, object]] = (), removed: Iterable[Tuple[str, int]] = (),
+              changed: Dict[Tuple[str, int], object] = None) -> Dict:
+        """Applies a line diff to one source.
+
+        added: (account, value) pairs, removed: line keys, changed: {line key: new value}. Raw cell values
+        go through normalize_numbers. Returns what moved: categories, basics and compare_ratios output.
+        """
+        lines = self.sources.setdefault(source, {})
+        touched = set()
+        for key in removed:
+            account, value = lines.pop(key)
+            self._contribute(key[0], value, -1.0, touched)
+        for key, raw in (changed or {}).items():
+            account, value = lines[key]
+            new = self._number(raw)
+            self._contribute(key[0], value, -1.0, touched)
+            self._contribute(key[0], new, 1.0, touched)
+            lines[key] = (account, new)
+        added = list(added)
+        values = self._numbers([raw for _, raw in added])
+        counts = self._next.setdefault(source, {})
+        for (account, _), value in zip(added, values):
+            label = norm(account)
+            n = counts.get(label, 0)
+            counts[label] = n + 1
+            lines[(label, n)] = (account, value)
+            self._contribute(label, value, 1.0, touched)
+        return self._refresh(touched)
+
+    def _numbers(self, raw: List) -> List[float]:
+        if not raw:
+            return []
+        values, _ = normalize_numbers(pd.Series(raw, dtype=object), self.decimal, self.scale)
+        return values.tolist()
+
+    def _number(self, raw) -> float:
+        return self._numbers([raw])[0]
+
+    def set_source(self, source: str, df: pd.DataFrame) -> Dict:
+        """Adds a statement, or diffs an amended version against the lines already held for source."""
+        new, self.unparseable[source] = statement_lines(df, self.decimal, self.scale)
+        old = self.sources.setdefault(source, {})
+        touched = set()
+        for key in [k for k in old if k not in new]:
+            self._contribute(key[0], old.pop(key)[1], -1.0, touched)
+        for key, line in new.items():
+            prev = old.get(key)
+            if prev is not None and _same(prev[1], line[1]):
+                continue
+            if prev is not None:
+                self._contribute(key[0], prev[1], -1.0, touched)
+            self._contribute(key[0], line[1], 1.0, touched)
+            old[key] = line
+        next_ = self._next[source] = {}
+        for label, n in old:
+            next_[label] = max(next_.get(label, 0), n + 1)
+        return self._refresh(touched)
+
+    def rename_source(self, old: str, new: str):
+        for d in (self.sources, self._next, self.unparseable):
+            if old in d:
+                d[new] = d.pop(old)
+
+    def remove_source(self, source: str) -> Dict:
+        touched = set()
+        for key, (_, value) in self.sources.pop(source, {}).items():
+            self._contribute(key[0], value, -1.0, touched)
+        self._next.pop(source, None)
+        self.unparseable.pop(source, None)
+        return self._refresh(touched)
+
+    def unparseable_report(self) -> Dict:
+        reports = list(self.unparseable.values())
+        return {"count": sum(r["count"] for r in reports), "sample": [v for r in reports for v in r["sample"]][:20]}
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import uuid
+import socket
+import shutil
+import sqlite3
+import tempfile
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import metrics
+from metrics import REGISTRY
+
+JOB_DIR = os.environ.get("CLEARPASS_JOB_DIR", os.path.join(tempfile.gettempdir(), "clearpass-jobs"))
+JOB_WORKERS = int(os.environ.get("CLEARPASS_JOB_WORKERS", "0")) or os.cpu_count() or 1
+JOB_QUEUE_SIZE = int(os.environ.get("CLEARPASS_JOB_QUEUE", "1000"))
+JOB_TIMEOUT = float(os.environ.get("CLEARPASS_JOB_TIMEOUT", "600"))
+JOB_TTL = float(os.environ.get("CLEARPASS_JOB_TTL_HOURS", "24")) * 3600
+# A running job whose owner has not touched it for JOB_HEARTBEAT * 3 seconds is taken to be orphaned.
+JOB_HEARTBEAT = float(os.environ.get("CLEARPASS_JOB_HEARTBEAT", "10"))
+# How often a running job checks for a cancel, which may come from any process sharing the store.
+JOB_CANCEL_POLL = float(os.environ.get("CLEARPASS_JOB_CANCEL_POLL", "1"))
+
+QUEUED, RUNNING = "queued", "running"
+SUCCEEDED, FAILED, CANCELLED, TIMED_OUT = "succeeded", "failed", "cancelled", "timed_out"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+class QueueFull(Exception):
+    pass
+
+class JobStore:
+    """Job state in a local SQLite file; the table doubles as the queue, so queued work survives restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, started REAL, finished REAL,
+                timeout REAL NOT NULL, done INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL,
+                files TEXT NOT NULL, result TEXT, error TEXT)""")
+            con.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            columns = {r[1] for r in con.execute("PRAGMA table_info(jobs)")}
+            for col, kind in (("owner", "TEXT"), ("heartbeat", "REAL"), ("cancel_requested", "INTEGER NOT NULL DEFAULT 0")):
+                if col not in columns:
+                    con.execute(f"ALTER TABLE jobs ADD COLUMN {col} {kind}")
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _pending(self, con) -> int:
+        return con.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchone()[0]
+
+    def pending(self) -> int:
+        with self._lock, self._connect() as con:
+            return self._pending(con)
+
+    def add(self, job_id: str, files: List[Dict], timeout: float, limit: int):
+        with self._lock, self._connect() as con:
+            pending = self._pending(con)
+            if pending >= limit:
+                raise QueueFull(f"{pending} jobs pending")
+            con.execute("INSERT INTO jobs (id, status, created, timeout, total, files) VALUES (?, ?, ?, ?, ?, ?)",
+                        (job_id, QUEUED, time.time(), timeout, len(files), json.dumps(files)))
+
+    def claim(self, owner: str) -> Optional[Dict]:
+        with self._lock, self._connect() as con:
+            # BEGIN IMMEDIATE so two processes sharing the file cannot both claim the same row.
+            con.execute("BEGIN IMMEDIATE")
+            row = con.execute("SELECT id, files, timeout FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            con.execute("UPDATE jobs SET status = ?, started = ?, owner = ?, heartbeat = ? WHERE id = ?", (RUNNING, now, owner, now, row[0]))
+            return {"id": row[0], "files": json.loads(row[1]), "timeout": row[2]}
+
+    def heartbeat(self, job_id: str, owner: str):
+        with self._lock, self._connect() as con:
+            con.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ? AND status = ?", (time.time(), job_id, owner, RUNNING))
+
+    def request_cancel(self, job_id: str) -> bool:
+        """Flags a running job for its owner to kill; False if it is not running."""
+        with self._lock, self._connect() as con:
+            return con.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)).rowcount > 0
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock, self._connect() as con:
+            row = con.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def progress(self, job_id: str, done: int):
+        with self._lock, self._connect() as con:
+            con.execute("UPDATE jobs SET done = ? WHERE id = ?", (done, job_id))
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None, only=(QUEUED, RUNNING)) -> bool:
+        """Moves a job whose status is one of `only` to a final status; False if it was in any other state."""
+        marks = ", ".join("?" * len(only))
+        with self._lock, self._connect() as con:
+            cur = con.execute(f"UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ? AND status IN ({marks})",
+                              (status, time.time(), None if result is None else json.dumps(result), error, job_id, *only))
+            return cur.rowcount > 0
+
+    def files(self, job_id: str) -> List[Dict]:
+        with self._lock, self._connect() as con:
+            row = con.execute("SELECT files FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return [] if row is None else json.loads(row[0])
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock, self._connect() as con:
+            row = con.execute("SELECT id, status, created, started, finished, timeout, done, total, result, error FROM jobs WHERE id = ?",
+                              (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "status", "created", "started", "finished", "timeout", "done", "total", "result", "error"), row))
+        job["progress"] = round(job["done"] / job["total"], 4) if job["total"] else 1.0
+        job["result"] = None if job["result"] is None else json.loads(job["result"])
+        return job
+
+    def requeue(self, job_id: str) -> int:
+        """Puts a running job back in the queue."""
+        with self._lock, self._connect() as con:
+            return con.execute("UPDATE jobs SET status = ?, started = NULL, done = 0, owner = NULL WHERE id = ? AND status = ?",
+                               (QUEUED, job_id, RUNNING)).rowcount
+
+    def requeue_orphans(self, stale_after: float) -> int:
+        """Requeues running jobs whose owner is gone: a dead pid on this host, or no heartbeat for stale_after seconds.
+
+        Jobs held by live processes sharing the store (e.g. uvicorn --workers N) are left alone.
+        """
+        host = socket.gethostname()
+        cutoff = time.time() - stale_after
+        with self._lock, self._connect() as con:
+            rows = con.execute("SELECT id, owner, heartbeat FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            orphans = [(job_id, owner) for job_id, owner, beat in rows
+                       if beat is None or beat < cutoff or not _owner_alive(owner, host)]
+            return sum(con.execute("UPDATE jobs SET status = ?, started = NULL, done = 0, owner = NULL "
+                                   "WHERE id = ? AND status = ? AND owner IS ?", (QUEUED, job_id, RUNNING, owner)).rowcount
+                       for job_id, owner in orphans)
+
+    def prune(self, older_than: float) -> List[str]:
+        with self._lock, self._connect() as con:
+            ids = [r[0] for r in con.execute("SELECT id FROM jobs WHERE finished < ?", (older_than,))]
+            con.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+        return ids
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _owner_alive(owner: Optional[str], host: str) -> bool:
+    """False when owner names a process on this host that no longer exists; other hosts rely on the heartbeat."""
+    if not owner:
+        return False
+    owner_host, _, pid = owner.rpartition(":")
+    if owner_host != host or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def run_files(files: List[Dict], instrument: bool, progress=None) -> Dict:
+    """Analyzes a job's spooled uploads one by one (zip members included) with the shared result cache.
+
+    Each file is {name, path, digest} plus optional pdf_options for read_upload.
+    """
+    from pipeline import analyze_file, analyze_file_path, expand_uploads, cache_kind
+    from result_cache import default_cache
+    cache = default_cache()
+    results = []
+    for done, f in enumerate(files, 1):
+        opts = f.get("pdf_options")
+        if f["name"].lower().endswith(".zip"):
+            with open(f["path"], "rb") as fh:
+                try:
+                    items = expand_uploads([(f["name"], fh.read())])
+                except Exception as e:
+                    items = []
+                    results.append({"file": f["name"], "ok": False, "basics": None, "ratios": None, "unparseable": None,
+                                    "error": f"{type(e).__name__}: {e}", "elapsed_ms": None, "cached": False})
+            todo = [(name, data, cache.key(data, kind=cache_kind(name, opts)), analyze_file) for name, data in items]
+        else:
+            todo = [(f["name"], f["path"], cache.key_for_digest(f["digest"], kind=cache_kind(f["name"], opts)), analyze_file_path)]
+        for name, source, key, analyze in todo:
+            hit = cache.get(key)
+            if hit is not None:
+                res = {"file": name, "ok": True, **hit, "error": None, "elapsed_ms": 0.0, "cached": True}
+            else:
+                res = analyze(name, source, instrument, opts)
+                if res["ok"]:
+                    cache.put(key, {"basics": res["basics"], "ratios": res["ratios"], "unparseable": res["unparseable"]})
+                res["cached"] = False
+            results.append(res)
+        if progress is not None:
+            progress(done)
+    return {"count": len(results), "failed": sum(1 for r in results if not r["ok"]), "results": results}
+
+def _worker_main(conn):
+    # Pay for the pandas/parsing imports while idle rather than on the first job.
+    import pipeline, result_cache
+    while True:
+        try:
+            files = conn.recv()
+        except EOFError:
+            return
+        if files is None:
+            return
+        try:
+            result = run_files(files, metrics.ENABLED, lambda done: conn.send(("progress", done)))
+            conn.send(("done", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+class _Slot(threading.Thread):
+    """Feeds jobs to one long-lived worker process, which is killed and replaced on timeout or cancel."""
+
+    def __init__(self, queue: "JobQueue", index: int):
+        super().__init__(name=f"clearpass-job-slot-{index}", daemon=True)
+        self.queue = queue
+        self.proc = None
+        self.conn = None
+
+    def _start_worker(self):
+        ctx = mp.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def _kill_worker(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.join()
+            self.conn.close()
+        self.proc = self.conn = None
+
+    def stop(self):
+        if self.proc is not None and self.proc.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.proc.join(5)
+        self._kill_worker()
+
+    def run(self):
+        q = self.queue
+        self._start_worker()
+        while not q.stopping.is_set():
+            job = q.store.claim(q.owner)
+            if job is None:
+                q.reap()
+                with q.wakeup:
+                    q.wakeup.wait(1.0)
+                continue
+            if self._run(job):
+                q.cleanup(job["files"])
+        self.stop()
+
+    def _run(self, job: Dict) -> bool:
+        """Runs one claimed job to a final status; False if it was handed back to the queue instead."""
+        q = self.queue
+        if q.store.cancel_requested(job["id"]):
+            # Cancelled while running elsewhere and requeued since.
+            q.finish(job["id"], CANCELLED)
+            return True
+        if self.proc is None or not self.proc.is_alive():
+            self._kill_worker()
+            self._start_worker()
+        deadline = time.monotonic() + job["timeout"]
+        beat = time.monotonic() + JOB_HEARTBEAT
+        cancelled, check = False, time.monotonic() + JOB_CANCEL_POLL
+        self.conn.send(job["files"])
+        while True:
+            if time.monotonic() > beat:
+                q.store.heartbeat(job["id"], q.owner)
+                beat = time.monotonic() + JOB_HEARTBEAT
+            if time.monotonic() > check:
+                cancelled = q.store.cancel_requested(job["id"])
+                check = time.monotonic() + JOB_CANCEL_POLL
+            if self.conn.poll(0.1):
+                try:
+                    kind, payload = self.conn.recv()
+                except (EOFError, OSError):
+                    self._kill_worker()
+                    q.finish(job["id"], FAILED, error="worker process exited")
+                    return True
+                if kind == "progress":
+                    q.store.progress(job["id"], payload)
+                elif kind == "done":
+                    q.finish(job["id"], SUCCEEDED, result=payload)
+                    return True
+                else:
+                    q.finish(job["id"], FAILED, error=payload)
+                    return True
+            elif cancelled:
+                self._kill_worker()
+                q.finish(job["id"], CANCELLED)
+                return True
+            elif time.monotonic() > deadline:
+                self._kill_worker()
+                q.finish(job["id"], TIMED_OUT, error=f"timed out after {job['timeout']:g}s")
+                return True
+            elif q.stopping.is_set():
+                # Leave the job queued for the next process rather than recording a failure.
+                self._kill_worker()
+                q.store.requeue(job["id"])
+                return False
+            elif not self.proc.is_alive():
+                self._kill_worker()
+                q.finish(job["id"], FAILED, error="worker process exited")
+                return True
+
+class JobQueue:
+    """Bounded background queue for analyses too slow for a request/response cycle.
+
+    Uploads are spooled under job_dir, state lives in job_dir/jobs.sqlite and each of `workers`
+    slots runs jobs in its own worker process so a timed-out or cancelled job can be killed.
+    """
+
+    def __init__(self, job_dir: str = JOB_DIR, workers: int = JOB_WORKERS, max_pending: int = JOB_QUEUE_SIZE,
+                 timeout: float = JOB_TIMEOUT, ttl: float = JOB_TTL):
+        os.makedirs(job_dir, exist_ok=True)
+        self.job_dir = job_dir
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.ttl = ttl
+        self.store = JobStore(os.path.join(job_dir, "jobs.sqlite"))
+        self.owner = _owner()
+        self._reaped = float("-inf")
+        self.reap()
+        self.stopping = threading.Event()
+        self.wakeup = threading.Condition()
+        self.slots = [_Slot(self, i) for i in range(workers)]
+        for slot in self.slots:
+            slot.start()
+
+    def reap(self):
+        """Hands jobs of dead owners back to the queue, at most once per heartbeat interval."""
+        now = time.monotonic()
+        if now - self._reaped >= JOB_HEARTBEAT:
+            self._reaped = now
+            self.store.requeue_orphans(JOB_HEARTBEAT * 3)
+
+    def full(self) -> bool:
+        return self.store.pending() >= self.max_pending
+
+    def new_job_dir(self) -> str:
+        return tempfile.mkdtemp(prefix="job-", dir=self.job_dir)
+
+    def submit(self, files: List[Dict], timeout: float = None) -> str:
+        """Queues spooled files ({name, path, digest[, pdf_options]}); raises QueueFull when max_pending jobs are waiting."""
+        job_id = uuid.uuid4().hex
+        self.store.add(job_id, files, timeout or self.timeout, self.max_pending)
+        with self.wakeup:
+            self.wakeup.notify()
+        self.store.prune(time.time() - self.ttl)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        # Only a job still queued is cancelled in place; a running one is flagged in the store, and
+        # whichever process owns it kills the worker when it next checks.
+        if job["status"] == QUEUED and self.finish(job_id, CANCELLED, only=(QUEUED,)):
+            self.cleanup(self.store.files(job_id))
+        else:
+            self.store.request_cancel(job_id)
+        return self.store.get(job_id)
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None, only=(QUEUED, RUNNING)) -> bool:
+        results = (result or {}).get("results", [])
+        breakdowns = [res.pop("timings", None) for res in results]
+        if not self.store.finish(job_id, status, result, error, only):
+            return False
+        if metrics.ENABLED:
+            REGISTRY.jobs.inc(status=status)
+            for res, breakdown in zip(results, breakdowns):
+                REGISTRY.ingest(breakdown or {})
+                REGISTRY.files.inc(outcome="ok" if res["ok"] else "error")
+        return True
+
+    def cleanup(self, files: List[Dict]):
+        for d in {os.path.dirname(f["path"]) for f in files}:
+            if os.path.dirname(d) == self.job_dir:
+                shutil.rmtree(d, ignore_errors=True)
+
+    def shutdown(self):
+        self.stopping.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for slot in self.slots:
+            slot.join()
@@ -1,15 +1,375 @@
-from fastapi import FastAPI, UploadFile, File
-import pandas as pd
-from shared.parsing import parse_financials, compute_ratios
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+import time
+import asyncio
+import zipfile
+import threading
+import multiprocessing as mp
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
+from pydantic import BaseModel
+from jobs import JobQueue, QueueFull
+import metrics
+from metrics import REGISTRY
+
+# pandas/NumPy-backed modules (shared.parsing, pipeline, result_cache, reports, ...) are imported
+# where they are used, so the process can bind its port before paying for them; PRELOAD warms them
+# in a background thread once the app has started.
 
 app = FastAPI(title="ClearPass API", version="0.1.0")
 
+MAX_WORKERS = int(os.environ.get("CLEARPASS_WORKERS", "0")) or None
+PRELOAD = os.environ.get("CLEARPASS_PRELOAD", "1").lower() not in ("0", "false", "no", "")
+STRESS_MAX_SCENARIOS = int(os.environ.get("CLEARPASS_STRESS_MAX_SCENARIOS", "1000000"))
+_pool = None
+_renderer = None
+_jobs = None
+
+def _import_analysis():
+    import pipeline, result_cache
+    from shared.parsing import default_benchmark_store
+    default_benchmark_store()
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawned rather than forked: a fork taken while the preload thread holds the import lock
+        # would leave the worker deadlocked in its initializer.
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=mp.get_context("spawn"), initializer=_import_analysis)
+    return _pool
+
+@app.on_event("startup")
+def _preload():
+    if PRELOAD:
+        threading.Thread(target=_import_analysis, name="clearpass-preload", daemon=True).start()
+
+@app.on_event("shutdown")
+def _shutdown_pool():
+    global _pool, _renderer, _jobs
+    _renderer = None
+    if _jobs is not None:
+        _jobs.shutdown()
+        _jobs = None
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        from reports import ReportRenderer
+        _renderer = ReportRenderer(executor=get_pool())
+    return _renderer
+
+def get_jobs() -> JobQueue:
+    global _jobs
+    if _jobs is None:
+        _jobs = JobQueue()
+    return _jobs
+
+@app.middleware("http")
+async def _observe_requests(request: Request, call_next):
+    if not metrics.ENABLED:
+        return await call_next(request)
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        REGISTRY.request_seconds.observe(time.perf_counter() - t0, route=path)
+        REGISTRY.requests.inc(route=path, method=request.method, status=str(status))
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _record(breakdown: Optional[Dict], upload_read: float, ok: bool) -> Dict:
+    breakdown = dict(breakdown or {})
+    breakdown["stages"] = {"upload_read": round(upload_read, 6), **breakdown.get("stages", {})}
+    if metrics.ENABLED:
+        REGISTRY.ingest(breakdown)
+        REGISTRY.files.inc(outcome="ok" if ok else "error")
+    return breakdown
+
+async def _spool(file: UploadFile, dir: str = None):
+    """Copies a large upload to a temp file in blocks, hashing as it goes; returns (path, sha256)."""
+    digest = hashlib.sha256()
+    suffix = os.path.splitext(file.filename or "")[1]
+    with tempfile.NamedTemporaryFile(prefix="clearpass-", suffix=suffix, dir=dir, delete=False) as out:
+        def consume(block):
+            digest.update(block)
+            out.write(block)
+        while True:
+            block = await file.read(2**20)
+            if not block:
+                break
+            await asyncio.to_thread(consume, block)
+    return out.name, digest.hexdigest()
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _pdf_options(pages: Optional[str], stop_when_found: bool) -> Optional[Dict]:
+    from pipeline import pdf_read_options
+    try:
+        return pdf_read_options(pages, stop_when_found)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"pages: {e}")
+
 @app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
-    if file.filename.lower().endswith(".csv"):
-        df = pd.read_csv(file.file)
+async def analyze(file: UploadFile = File(...), timings: bool = False, borrower: Optional[str] = None,
+                  fiscal_year: Optional[int] = None, pages: Optional[str] = None, stop_when_found: bool = False):
+    """Analyzes one statement; with borrower and fiscal_year the result is also kept in the statement store.
+
+    For PDFs, pages ("3-12") limits table extraction to a page range and stop_when_found stops once
+    the income statement, balance sheet and cash flow lines have been seen.
+    """
+    from pipeline import analyze_bytes, analyze_path, cache_kind, STREAM_THRESHOLD, STREAMABLE
+    from result_cache import default_cache
+    pdf_options = _pdf_options(pages, stop_when_found)
+    t0 = time.perf_counter()
+    path = None
+    if (file.size or 0) > STREAM_THRESHOLD and (file.filename or "").lower().endswith(STREAMABLE):
+        path, digest = await _spool(file)
+        job = (partial(analyze_path, pdf_options=pdf_options), file.filename, path)
     else:
-        df = pd.read_excel(file.file)
-    basics, _ = parse_financials(df)
-    ratios = compute_ratios(basics)
-    return {"basics": basics, "ratios": ratios}
+        data = await file.read()
+        # Hashing and the cache's SQLite tier block, so they run off the event loop.
+        digest = await asyncio.to_thread(_sha256, data)
+        job = (partial(analyze_bytes, pdf_options=pdf_options), file.filename, data)
+    upload_read = time.perf_counter() - t0
+    try:
+        cache = default_cache()
+        key = cache.key_for_digest(digest, kind=cache_kind(file.filename, pdf_options))
+        result = await asyncio.to_thread(cache.get, key)
+        if result is not None:
+            breakdown = {"cached": True, **_record(None, upload_read, True)}
+        else:
+            loop = asyncio.get_running_loop()
+            instrument = metrics.ENABLED or timings
+            result = await loop.run_in_executor(get_pool(), *job, instrument)
+            breakdown = _record(result.pop("timings", None), upload_read, True)
+            await asyncio.to_thread(cache.put, key, result)
+    finally:
+        if path is not None:
+            os.unlink(path)
+    if borrower is not None and fiscal_year is not None:
+        from statement_store import default_statement_store
+        store = default_statement_store()
+        if store is not None:
+            # Off the event loop: the append may wait on another process's lock or trigger a compaction.
+            try:
+                await asyncio.to_thread(store.append, borrower, fiscal_year, result["basics"], result["ratios"])
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+    if timings:
+        breakdown["total"] = round(time.perf_counter() - t0, 6)
+        result["timings"] = breakdown
+    return result
+
+@app.get("/borrowers/{borrower}/history")
+def borrower_history(borrower: str, start: Optional[int] = None, end: Optional[int] = None):
+    from pipeline import jsonable
+    from statement_store import default_statement_store
+    store = default_statement_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="No statement store configured (CLEARPASS_STORE_PATH)")
+    years = None if start is None and end is None else (start or 0, end or 9999)
+    frame = store.frame([borrower], years).droplevel("Borrower")
+    return {"borrower": borrower, "metrics": list(frame.columns),
+            "years": {int(y): jsonable(row) for y, row in zip(frame.index, frame.to_dict("records"))}}
+
+@app.post("/store/compact")
+def compact_store():
+    from statement_store import default_statement_store
+    store = default_statement_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="No statement store configured (CLEARPASS_STORE_PATH)")
+    store.compact()
+    return {"rows": len(store), "borrowers": len(store.borrowers), "generation": store.generation}
+
+@app.post("/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...), timings: bool = False, pages: Optional[str] = None,
+                        stop_when_found: bool = False):
+    """Analyzes several statements and zips of them; pages and stop_when_found apply to every PDF."""
+    from pipeline import analyze_file, expand_uploads, cache_kind
+    from result_cache import default_cache
+    pdf_options = _pdf_options(pages, stop_when_found)
+    t0 = time.perf_counter()
+    uploads = [(f.filename, await f.read()) for f in files]
+    upload_read = (time.perf_counter() - t0) / max(len(uploads), 1)
+    cache = default_cache()
+
+    def lookup():
+        # Unzipping, hashing and the cache's SQLite tier all block, so they run off the event loop.
+        items = expand_uploads(uploads)
+        keys = [cache.key(data, kind=cache_kind(name, pdf_options)) for name, data in items]
+        return items, keys, [cache.get(key) for key in keys]
+    try:
+        items, keys, hits = await asyncio.to_thread(lookup)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive: {e}")
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    instrument = metrics.ENABLED or timings
+    results = [None] * len(items)
+    misses = []
+    for i, ((name, _), hit) in enumerate(zip(items, hits)):
+        if hit is not None:
+            results[i] = {"file": name, "ok": True, **hit, "error": None, "elapsed_ms": 0.0, "cached": True}
+            breakdown = {"cached": True, **_record(None, upload_read, True)}
+            if timings:
+                results[i]["timings"] = breakdown
+        else:
+            misses.append(i)
+    analyze = partial(analyze_file, pdf_options=pdf_options)
+    futures = [loop.run_in_executor(pool, analyze, *items[i], instrument) for i in misses]
+    for i, res in zip(misses, await asyncio.gather(*futures, return_exceptions=True)):
+        if isinstance(res, BaseException):
+            res = {"file": items[i][0], "ok": False, "basics": None, "ratios": None, "unparseable": None,
+                   "error": f"{type(res).__name__}: {res}", "elapsed_ms": None}
+        elif res["ok"]:
+            await asyncio.to_thread(cache.put, keys[i], {"basics": res["basics"], "ratios": res["ratios"],
+                                                          "unparseable": res["unparseable"]})
+        breakdown = _record(res.pop("timings", None), upload_read, res["ok"])
+        if timings:
+            res["timings"] = breakdown
+        res["cached"] = False
+        results[i] = res
+    return {
+        "count": len(results),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "results": results,
+    }
+
+def _compare(original: tuple, amended: tuple) -> Dict:
+    from pipeline import read_upload, jsonable
+    from incremental import IncrementalAnalysis
+    inc = IncrementalAnalysis()
+    inc.set_source("statement", read_upload(*original))
+    before = {"basics": jsonable(inc.basics), "ratios": inc.ratios}
+    changes = inc.set_source("statement", read_upload(*amended))
+    return {"original": before, "amended": {"basics": jsonable(inc.basics), "ratios": inc.ratios},
+            "changed_categories": changes["categories"],
+            "basics": {k: jsonable(v) for k, v in changes["basics"].items()},
+            "ratios": changes["ratios"], "unparseable": inc.unparseable_report()}
+
+@app.post("/analyze/compare")
+async def analyze_compare(original: UploadFile = File(...), amended: UploadFile = File(...)):
+    """Diffs an amended statement against the original; reports the basics and ratios that moved."""
+    a = (original.filename, await original.read())
+    b = (amended.filename, await amended.read())
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), _compare, a, b)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...), timeout: Optional[float] = None, pages: Optional[str] = None,
+                     stop_when_found: bool = False):
+    """Queues uploads (statements or zips) for background analysis; poll GET /jobs/{id} for the result."""
+    pdf_options = _pdf_options(pages, stop_when_found)
+    queue = get_jobs()
+    if await asyncio.to_thread(queue.full):
+        raise HTTPException(status_code=429, detail="Job queue is full; retry later", headers={"Retry-After": "30"})
+    job_dir = queue.new_job_dir()
+    try:
+        spooled = []
+        for f in files:
+            path, digest = await _spool(f, dir=job_dir)
+            spooled.append({"name": f.filename, "path": path, "digest": digest, "pdf_options": pdf_options})
+        job_id = await asyncio.to_thread(queue.submit, spooled, timeout)
+    except QueueFull as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=429, detail=f"Job queue is full ({e}); retry later", headers={"Retry-After": "30"})
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = get_jobs().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+class ReportRequest(BaseModel):
+    company: str
+    fiscal_year: str = ""
+    industry: str
+    naics: Optional[str] = None
+    basics: Dict[str, Optional[float]]
+    ratios: Optional[Dict[str, Optional[float]]] = None
+    format: str = "pdf"
+
+async def _render(req: ReportRequest) -> bytes:
+    from shared.parsing import compute_ratios, default_benchmark_store
+    from reports import REPORT_FORMATS
+    if req.format not in REPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {list(REPORT_FORMATS)}")
+    ratios = req.ratios if req.ratios is not None else compute_ratios(req.basics)
+    # Unlike benchmark_for, no fallback to the first industry: a report against the wrong peers is worse than none.
+    try:
+        bench = default_benchmark_store().benchmark(naics=req.naics, name=req.industry)
+    except KeyError as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    fut = get_renderer().submit(req.format, req.company, req.fiscal_year, req.industry, req.basics, ratios, bench)
+    return await asyncio.wrap_future(fut)
+
+@app.post("/report")
+async def report(req: ReportRequest):
+    from reports import MEDIA_TYPES, report_filename, content_disposition
+    data = await _render(req)
+    disposition = content_disposition(report_filename(req.format, req.company))
+    return Response(content=data, media_type=MEDIA_TYPES[req.format], headers={"Content-Disposition": disposition})
+
+@app.post("/reports")
+async def reports(reqs: List[ReportRequest]):
+    from reports import report_filename
+    rendered = await asyncio.gather(*[_render(r) for r in reqs])
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, (req, data) in enumerate(zip(reqs, rendered)):
+            zf.writestr(f"{i:04d}_{report_filename(req.format, req.company)}", data)
+    return Response(content=buf.getvalue(), media_type="application/zip",
+                    headers={"Content-Disposition": 'attachment; filename="underwriting_reports.zip"'})
+
+class StressRequest(BaseModel):
+    basics: Dict[str, Optional[float]]
+    scenarios: Optional[Dict[str, Dict[str, float]]] = None
+    monte_carlo: Optional[Dict[str, Any]] = None
+    n: int = 10_000
+    seed: Optional[int] = None
+    floating_share: float = 1.0
+
+@app.post("/stress")
+def stress_test(req: StressRequest):
+    from pipeline import jsonable
+    import stress
+    if not 0 < req.n <= STRESS_MAX_SCENARIOS:
+        raise HTTPException(status_code=422, detail=f"n must be between 1 and {STRESS_MAX_SCENARIOS}")
+    # null is a missing line as /analyze reports it, which the ratios saw as NaN.
+    basics = {k: float("nan") if v is None else v for k, v in req.basics.items()}
+    try:
+        table = stress.scenario_table(basics, req.scenarios, req.floating_share)
+        out = {"scenarios": {name: jsonable(row) for name, row in zip(table.index, table.to_dict("records"))}}
+        if req.monte_carlo is not None:
+            out["monte_carlo"] = stress.monte_carlo(basics, req.monte_carlo, req.n, req.seed, req.floating_share)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return out
@@ -0,0 +1,154 @@
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+ENABLED = os.environ.get("CLEARPASS_METRICS", "1").lower() not in ("0", "false", "no", "")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(key)} {v:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                cum = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    cum += c
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_labels(key, le)} {cum}")
+                lines.append(f"{self.name}_sum{_labels(key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(key)} {n}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.stage_seconds = Histogram("clearpass_stage_seconds", "Time spent in each analysis stage.")
+        self.request_seconds = Histogram("clearpass_http_request_seconds", "HTTP request latency by route.")
+        self.requests = Counter("clearpass_http_requests_total", "HTTP requests by route and status.")
+        self.rows_parsed = Counter("clearpass_rows_parsed_total", "Statement rows parsed.")
+        self.rows_matched = Counter("clearpass_rows_matched_total", "Statement rows tagged with each category.")
+        self.rows_unmatched = Counter("clearpass_rows_unmatched_total", "Statement rows matching no category.")
+        self.files = Counter("clearpass_files_analyzed_total", "Files analyzed by outcome.")
+        self.jobs = Counter("clearpass_jobs_total", "Background jobs by final status.")
+        self.values_unparseable = Counter("clearpass_values_unparseable_total", "Value cells that could not be read as numbers.")
+        self.label_cache_hits = Counter("clearpass_label_cache_hits_total", "Distinct labels classified from the label cache.")
+        self.label_cache_misses = Counter("clearpass_label_cache_misses_total", "Distinct labels classified afresh.")
+
+    def ingest(self, breakdown: Dict):
+        """Folds a StageRecorder breakdown (possibly produced in a worker process) into the registry."""
+        for name, seconds in breakdown.get("stages", {}).items():
+            self.stage_seconds.observe(seconds, stage=name)
+        rows = breakdown.get("rows")
+        if rows:
+            self.rows_parsed.inc(rows["parsed"])
+            self.rows_unmatched.inc(rows["unmatched"])
+            for category, n in rows["matched"].items():
+                if n:
+                    self.rows_matched.inc(n, category=category)
+        unparseable = breakdown.get("unparseable")
+        if unparseable:
+            self.values_unparseable.inc(unparseable["count"])
+        labels = breakdown.get("label_cache")
+        if labels:
+            self.label_cache_hits.inc(labels["hits"])
+            self.label_cache_misses.inc(labels["misses"])
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.request_seconds, self.requests, self.stage_seconds, self.rows_parsed,
+                       self.rows_matched, self.rows_unmatched, self.values_unparseable, self.label_cache_hits,
+                       self.label_cache_misses, self.files, self.jobs):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class StageRecorder:
+    """Stage hook for shared.parsing that accumulates one analysis' timings and row counts."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.row_counts = None
+        self.unparseable_count = 0
+        self.unparseable_sample: List[str] = []
+        self.label_hits = 0
+        self.label_misses = 0
+
+    def stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def rows(self, parsed: int, matched: Dict[str, int], unmatched: int):
+        if self.row_counts is None:
+            self.row_counts = {"parsed": 0, "unmatched": 0, "matched": {}}
+        self.row_counts["parsed"] += parsed
+        self.row_counts["unmatched"] += unmatched
+        for k, n in matched.items():
+            self.row_counts["matched"][k] = self.row_counts["matched"].get(k, 0) + n
+
+    def unparseable(self, count: int, sample: List[str]):
+        self.unparseable_count += count
+        self.unparseable_sample.extend(sample[:max(0, 20 - len(self.unparseable_sample))])
+
+    def label_cache(self, hits: int, misses: int):
+        self.label_hits += hits
+        self.label_misses += misses
+
+    def unparseable_report(self) -> Dict:
+        return {"count": self.unparseable_count, "sample": list(self.unparseable_sample)}
+
+    def breakdown(self) -> Dict:
+        out = {"stages": {k: round(v, 6) for k, v in self.stages.items()}}
+        if self.row_counts is not None:
+            out["rows"] = self.row_counts
+        if self.unparseable_count:
+            out["unparseable"] = self.unparseable_report()
+        if self.label_hits or self.label_misses:
+            out["label_cache"] = {"hits": self.label_hits, "misses": self.label_misses}
+        return out
@@ -1,20 +1,142 @@
+import io
+import os
+import re
+import shutil
+import tempfile
 import pdfplumber
 import pandas as pd
-import re
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+STATEMENT_ANCHORS = ("revenue", "total_assets", "cfo")
+MAX_PAGE = 100_000
+
+def parse_page_ranges(spec) -> Optional[List[int]]:
+    """'1-3,7' / [1, 2, 3] / None -> sorted 1-based page numbers (None means all pages)."""
+    if spec is None:
+        return None
+    if isinstance(spec, str):
+        pages = set()
+        for part in spec.replace(" ", "").split(","):
+            if not part:
+                continue
+            lo, _, hi = part.partition("-")
+            lo, hi = int(lo), int(hi or lo)
+            if hi > MAX_PAGE:
+                raise ValueError(f"page {hi} is past the last page supported ({MAX_PAGE})")
+            pages.update(range(lo, hi + 1))
+    else:
+        pages = set(int(p) for p in spec)
+    if any(p < 1 for p in pages):
+        raise ValueError(f"page numbers start at 1: {spec!r}")
+    return sorted(pages)
 
-def extract_tables_to_long(file_like) -> pd.DataFrame:
+def _page_rows(page) -> List[Tuple[str, str]]:
     rows = []
-    with pdfplumber.open(file_like) as pdf:
+    for table in page.extract_tables() or []:
+        for row in table:
+            if not row or len(row) < 2:
+                continue
+            account = str(row[0]).strip()
+            value = str(row[1]).strip()
+            if account and re.search(r"[A-Za-z]", account) and re.search(r"[-\d,()]", value):
+                rows.append((account, value))
+    return rows
+
+def _iter_pages(source, pages: Optional[List[int]]) -> Iterator[Tuple[int, List[Tuple[str, str]]]]:
+    with pdfplumber.open(source, pages=pages) as pdf:
         for page in pdf.pages:
-            tables = page.extract_tables() or []
-            for table in tables:
-                for row in table:
-                    if not row or len(row) < 2:
-                        continue
-                    account = str(row[0]).strip()
-                    value = str(row[1]).strip()
-                    if account and re.search(r"[A-Za-z]", account) and re.search(r"[-\d,()]", value):
-                        rows.append((account, value))
+            try:
+                yield page.page_number, _page_rows(page)
+            finally:
+                page.close()
+
+def _extract_range(path: str, pages: List[int]) -> List[Tuple[int, List[Tuple[str, str]]]]:
+    return list(_iter_pages(path, pages))
+
+def page_count(source) -> int:
+    with pdfplumber.open(source) as pdf:
+        return len(pdf.pages)
+
+class _AnchorTracker:
+    def __init__(self, anchors: Iterable[str], grace_pages: int):
+        from shared.parsing import classifier_for
+        self.clf = classifier_for()
+        self.missing = set(anchors)
+        self.grace = grace_pages
+
+    def done_after(self, rows) -> bool:
+        if self.missing and rows:
+            hits = self.clf.classify([a for a, _ in rows]).any(axis=0)
+            self.missing -= {c for c, hit in zip(self.clf.categories, hits) if hit}
+        if self.missing:
+            return False
+        self.grace -= 1
+        return self.grace < 0
+
+def iter_table_rows(file_like, pages=None, stop_when_found: bool = False, anchors: Iterable[str] = STATEMENT_ANCHORS,
+                    grace_pages: int = 1, workers: int = 1, chunk_pages: int = 8) -> Iterator[Tuple[str, str]]:
+    """Yields (account, value) rows page by page, releasing each page's caches as it goes.
+
+    pages restricts extraction to a page-range hint ("3-12" or a list of 1-based numbers).
+    stop_when_found stops once every anchor category has been seen plus grace_pages more pages.
+    workers > 1 spreads chunk_pages-sized page ranges over a process pool; rows still arrive in page order.
+    """
+    pages = parse_page_ranges(pages)
+    if isinstance(file_like, (bytes, bytearray)):
+        file_like = io.BytesIO(file_like)
+    tracker = _AnchorTracker(anchors, grace_pages) if stop_when_found else None
+    if workers <= 1:
+        page_iter = _iter_pages(file_like, pages)
+    else:
+        page_iter = _iter_pages_parallel(file_like, pages, workers, chunk_pages)
+    try:
+        for _, rows in page_iter:
+            yield from rows
+            if tracker is not None and tracker.done_after(rows):
+                break
+    finally:
+        page_iter.close()
+
+def _iter_pages_parallel(file_like, pages, workers, chunk_pages):
+    # Workers get a path, never the document itself, so memory stays flat however long the PDF is;
+    # file objects are spooled to a temporary file once.
+    spooled = None
+    if isinstance(file_like, (str, os.PathLike)):
+        source = os.fspath(file_like)
+    else:
+        fd, source = tempfile.mkstemp(suffix=".pdf")
+        spooled = source
+        with os.fdopen(fd, "wb") as fh:
+            shutil.copyfileobj(file_like, fh)
+    try:
+        yield from _run_ranges(source, pages, workers, chunk_pages)
+    finally:
+        if spooled is not None:
+            os.unlink(spooled)
+
+def _run_ranges(source: str, pages, workers, chunk_pages):
+    if pages is None:
+        pages = list(range(1, page_count(source) + 1))
+    chunks = [pages[i:i + chunk_pages] for i in range(0, len(pages), chunk_pages)]
+    # Spawned: forking a server process that has threads running (preload, job slots) can deadlock the child.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        pending = [pool.submit(_extract_range, source, chunk) for chunk in chunks[:workers * 2]]
+        next_chunk = len(pending)
+        try:
+            while pending:
+                result = pending.pop(0).result()
+                if next_chunk < len(chunks):
+                    pending.append(pool.submit(_extract_range, source, chunks[next_chunk]))
+                    next_chunk += 1
+                yield from result
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+def extract_tables_to_long(file_like, pages=None, stop_when_found: bool = False, workers: int = 1) -> pd.DataFrame:
+    rows = iter_table_rows(file_like, pages=pages, stop_when_found=stop_when_found, workers=workers)
     df = pd.DataFrame(rows, columns=["Account","Value"]).dropna()
     if df.empty:
         return pd.DataFrame({"Account":[], "Value":[]})
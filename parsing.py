@@ -1,9 +1,17 @@
+import os
 import re
+import math
+import hashlib
+import threading
+import time
+from contextvars import ContextVar
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-from typing import Dict, List
+from typing import Dict, Iterable, List, Tuple
 
-BENCHMARKS = pd.DataFrame([
+# Built into the BENCHMARKS frame on first use (see __getattr__) so importing this module stays cheap.
+_BENCHMARK_ROWS = [
     (311,'Food Manufacturing',1.5,1.2,1.2,8.0,6.0),
     (423,'Wholesale Trade',1.6,1.3,1.0,6.0,5.0),
     (424,'Merchant Wholesalers',1.6,1.3,1.0,6.0,5.0),
@@ -13,7 +21,19 @@ BENCHMARKS = pd.DataFrame([
     (52,'Financial Services',1.5,1.3,1.5,10.0,8.0),
     (54,'Professional Services',1.8,1.6,0.8,12.0,10.0),
     (31,'Manufacturing (General)',1.5,1.2,1.2,8.0,6.0),
-], columns=['naics','industry_name','current_ratio_median','quick_ratio_median','d_to_e_median','profit_margin_median','roa_median'])
+]
+_BENCHMARK_COLUMNS = ['naics','industry_name','current_ratio_median','quick_ratio_median','d_to_e_median','profit_margin_median','roa_median']
+
+def _benchmarks() -> pd.DataFrame:
+    frame = globals().get("BENCHMARKS")
+    if frame is None:
+        frame = globals()["BENCHMARKS"] = pd.DataFrame(_BENCHMARK_ROWS, columns=_BENCHMARK_COLUMNS)
+    return frame
+
+def __getattr__(name):
+    if name == "BENCHMARKS":
+        return _benchmarks()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def default_keywords():
     return {
@@ -43,36 +63,328 @@ def default_keywords():
 def norm(s: str) -> str:
     return re.sub(r"\s+", " ", str(s).strip().lower())
 
-def find_number(x):
-    try:
-        return float(x)
-    except Exception:
-        try:
-            return float(str(x).replace(",","“).replace("(","-").replace(")",""))
-        except Exception:
-            return np.nan
+# Cells that mean "no value" rather than a malformed number.
+NULL_TOKENS = frozenset(["", "n/a", "na", "nan", "none", "null", "#n/a", "nm", "n.m."])
+SCALE_SUFFIXES = {"k": 1e3, "m": 1e6, "mm": 1e6, "mn": 1e6, "b": 1e9, "bn": 1e9}
 
-def wide_to_long(df: pd.DataFrame) -> pd.DataFrame:
+_DASH_RE = re.compile(r"^[-‒–—―−]+$")
+_NUMBER_RE = re.compile(r"""^(?P<open>\()?\s*
+    (?P<lead>[-+−])?\s*(?:[$€£¥₹]|[a-z]{3}\s)?\s*(?P<lead2>[-+−])?\s*
+    (?P<num>\d(?:[\d.,'\u00a0\u202f ]*\d)?|[.,]\d+)\s*
+    (?P<suffix>[kmb]|mm|mn|bn)?\.?\s*(?:[$€£¥₹]|\s[a-z]{3})?\s*
+    (?P<close>\))?\s*(?P<trail>[-−])?$""", re.X)
+_GROUPING = str.maketrans("", "", "'\u00a0\u202f ")
+_NEGATIVE = ("-", "−")
+
+_is_str = np.frompyfunc(lambda v: isinstance(v, str), 1, 1)
+
+def _decimal_mark(d: str, decimal: str):
+    """Which of '.'/',' is the decimal point in a digit group, '' for none, None if malformed."""
+    dots, commas = d.count("."), d.count(",")
+    if decimal == ".":
+        return None if dots > 1 else "." if dots else ""
+    if decimal == ",":
+        return None if commas > 1 else "," if commas else ""
+    # auto: the rightmost mark wins when both appear; a lone '.' is a decimal point and lone commas
+    # group thousands, as plain float()/to_numeric parsing always treated them.
+    if dots and commas:
+        last_dot, last_comma = d.rfind("."), d.rfind(",")
+        if last_comma > last_dot:
+            return "," if commas == 1 else None
+        return "." if dots == 1 else None
+    return "." if dots == 1 else ""
+
+def _parse_cell(text: str, decimal: str, suffixes: bool):
+    """(value, ok) for one stripped, lower-cased cell."""
+    if text in NULL_TOKENS:
+        return np.nan, True
+    if _DASH_RE.match(text):
+        return 0.0, True
+    m = _NUMBER_RE.match(text)
+    if m is None or (m["open"] is None) != (m["close"] is None) or (m["suffix"] and not suffixes):
+        return np.nan, False
+    d = m["num"].translate(_GROUPING)
+    mark = _decimal_mark(d, decimal)
+    if mark is None:
+        return np.nan, False
+    other = "," if mark == "." else "."
+    d = d.replace(other, "").replace(",", "") if mark != "," else d.replace(".", "").replace(",", ".")
+    value = float(d) * SCALE_SUFFIXES.get(m["suffix"], 1.0)
+    if m["open"] or m["lead"] in _NEGATIVE or m["lead2"] in _NEGATIVE or m["trail"]:
+        value = -value
+    return value, True
+
+def normalize_numbers(values, decimal: str = "auto", scale: float = 1.0, suffixes: bool = True):
+    """Parses a column of statement cells into floats.
+
+    Understands thousands separators, (1,234) and trailing-minus negatives, currency symbols and
+    codes, dashes for zero and k/m/bn scale suffixes. decimal is '.', ',' or 'auto'; every value is
+    multiplied by scale (e.g. 1000 for statements presented in thousands). Returns (float64 array,
+    unparseable mask); blanks and tokens such as 'n/a' are NaN but not flagged as unparseable.
+    """
+    if decimal not in ("auto", ".", ","):
+        raise ValueError("decimal must be 'auto', '.' or ','")
+    s = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return s.to_numpy(dtype=float, na_value=np.nan) * scale, np.zeros(len(s), dtype=bool)
+    cells = s.to_numpy(dtype=object)
+    if decimal == ",":
+        todo = _is_str(cells).astype(bool)
+        out = pd.to_numeric(pd.Series(np.where(todo, None, cells), dtype=object), errors="coerce").to_numpy(dtype=float, copy=True)
+    else:
+        # Plain numeric strings go through the C parser; only what it rejects needs the pattern.
+        out = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float, copy=True)
+        todo = np.isnan(out)
+        todo[todo] = _is_str(cells[todo]).astype(bool)
+    bad = np.zeros(len(s), dtype=bool)
+    if todo.any():
+        idx = np.flatnonzero(todo)
+        codes, uniques = pd.factorize(cells[idx])
+        parsed = [_parse_cell(u.strip().lower(), decimal, suffixes) for u in uniques]
+        vals = np.array([p[0] for p in parsed], dtype=float)
+        ok = np.array([p[1] for p in parsed], dtype=bool)
+        out[idx] = vals[codes]
+        bad[idx] = ~ok[codes]
+    return out * scale, bad
+
+def find_number(x, decimal: str = "auto"):
+    values, _ = normalize_numbers(pd.Series([x], dtype=object), decimal=decimal)
+    return float(values[0])
+
+def year_key(c):
+    m = re.search(r"(20\d\d)", str(c))
+    return int(m.group(1)) if m else -1
+
+def year_columns(df: pd.DataFrame) -> list:
     cols = [c for c in df.columns if re.search(r"(20\d\d)|(\bfy\d{2}\b)", str(c).lower())]
-    if len(cols)==0:
+    return sorted(cols, key=year_key)
+
+def wide_to_long(df: pd.DataFrame) -> pd.DataFrame:
+    cols_sorted = year_columns(df)
+    if len(cols_sorted)==0:
         df2 = df.iloc[:, :2].copy()
         df2.columns = ["Account","Value"]
         return df2
-    def year_key(c):
-        m = re.search(r"(20\d\d)", str(c))
-        return int(m.group(1)) if m else -1
-    cols_sorted = sorted(cols, key=year_key)
     latest = cols_sorted[-1]
     out = pd.DataFrame({"Account": df.iloc[:,0], "Value": df[latest]})
     return out
 
+def norm_series(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.strip().str.lower().str.replace(r"\s+", " ", regex=True)
+
+def keywords_fingerprint(kw_map: Dict[str, List[str]]) -> str:
+    blob = "\x1e".join(k + "\x1f" + "\x1f".join(pats) for k, pats in kw_map.items())
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+def _sums_exactly(vals: np.ndarray) -> bool:
+    # Integral values whose absolute total stays below 2**53 add up exactly in float64 in any order.
+    return bool(np.abs(vals).sum() < 2.0**53 and np.all(np.mod(vals, 1.0) == 0))
+
+class ExactSum:
+    """Running float sum with no rounding error (Shewchuk partials, as in math.fsum); also subtracts."""
+
+    __slots__ = ("partials",)
+
+    def __init__(self):
+        self.partials: List[float] = []
+
+    def add(self, x: float):
+        partials = self.partials
+        i = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                partials[i] = lo
+                i += 1
+            x = hi
+        partials[i:] = [x]
+
+    def add_array(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if _sums_exactly(values):
+            self.add(float(values.sum()))
+        else:
+            for x in values.tolist():
+                self.add(x)
+
+    @property
+    def value(self) -> float:
+        return math.fsum(self.partials)
+
+class LabelCache:
+    """Bounded, thread-safe LRU of (keyword fingerprint, normalized label) -> category row."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._data.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return row
+
+    def put(self, key, row):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = row
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def resize(self, maxsize: int):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+LABEL_CACHE = LabelCache(int(os.environ.get("CLEARPASS_LABEL_CACHE_SIZE", "4096")))
+
+class KeywordClassifier:
+    """Tags account labels with every category whose keyword patterns match.
+
+    Each category's patterns are compiled once into a single alternation, labels
+    are classified once per distinct normalized value, and aggregation is a
+    matrix product of the row values with the boolean category matrix.
+    """
+
+    def __init__(self, kw_map: Dict[str, List[str]] = None, cache: LabelCache = LABEL_CACHE):
+        self.kw_map = {k: list(v) for k, v in (default_keywords() if kw_map is None else kw_map).items()}
+        self.cache = cache
+        self.categories = list(self.kw_map.keys())
+        self.fingerprint = keywords_fingerprint(self.kw_map)
+        self._patterns = [re.compile("|".join(f"(?:{p})" for p in pats)) if pats else None
+                          for pats in self.kw_map.values()]
+
+    def _lookup(self, name: str) -> Tuple[np.ndarray, bool]:
+        if self.cache is not None:
+            row = self.cache.get((self.fingerprint, name))
+            if row is not None:
+                return row, True
+        row = np.array([bool(p is not None and p.search(name)) for p in self._patterns], dtype=bool)
+        row.flags.writeable = False
+        if self.cache is not None:
+            self.cache.put((self.fingerprint, name), row)
+        return row, False
+
+    def tag_normalized(self, name: str) -> np.ndarray:
+        return self._lookup(name)[0]
+
+    def tag(self, account_name: str) -> Dict[str, bool]:
+        return dict(zip(self.categories, self.tag_normalized(norm(account_name)).tolist()))
+
+    def classify(self, accounts) -> np.ndarray:
+        names = norm_series(pd.Series(accounts, dtype=object))
+        codes, uniques = pd.factorize(names, sort=False)
+        table = np.zeros((len(uniques), len(self.categories)), dtype=bool)
+        hits = 0
+        for i, name in enumerate(uniques):
+            table[i], hit = self._lookup(name)
+            hits += hit
+        hook = _STAGE_HOOK.get()
+        if hook is not None and self.cache is not None:
+            hook.label_cache(hits, len(uniques) - hits)
+        return table[codes]
+
+    def aggregate(self, accounts, values) -> Dict[str, float]:
+        totals = self.aggregate_columns(accounts, np.asarray(values, dtype=float)[:, None])[0]
+        return {k: float(v) for k, v in zip(self.categories, totals)}
+
+    def aggregate_columns(self, accounts, values) -> np.ndarray:
+        """Sums each value column per category; returns an (n_columns, n_categories) array."""
+        return self.totals(self.classify(accounts), values)
+
+    @staticmethod
+    def totals(matrix: np.ndarray, values) -> np.ndarray:
+        """Correctly rounded per-category sums, so results never depend on row order or chunking."""
+        vals = np.asarray(values, dtype=float)
+        vals = np.where(np.isnan(vals), 0.0, vals)
+        if _sums_exactly(vals):
+            return vals.T @ matrix.astype(float)
+        out = np.empty((vals.shape[1], matrix.shape[1]))
+        for k in range(matrix.shape[1]):
+            picked = vals[matrix[:, k]]
+            for j in range(vals.shape[1]):
+                out[j, k] = math.fsum(picked[:, j])
+        return out
+
+_CLASSIFIERS: Dict[str, KeywordClassifier] = {}
+
+def classifier_for(kw_map: Dict[str, List[str]] = None) -> KeywordClassifier:
+    if kw_map is None:
+        kw_map = default_keywords()
+    fp = keywords_fingerprint(kw_map)
+    clf = _CLASSIFIERS.get(fp)
+    if clf is None:
+        clf = _CLASSIFIERS[fp] = KeywordClassifier(kw_map)
+    return clf
+
 def match_category(account_name: str, kw_map: Dict[str, List[str]]):
-    name = norm(account_name)
-    import re
-    tags = {}
-    for k, pats in kw_map.items():
-        tags[k] = any(re.search(p, name) for p in pats)
-    return tags
+    return classifier_for(kw_map).tag(account_name)
+
+# Instrumentation: a hook object with stage(name, seconds), rows(parsed, matched_by_category, unmatched),
+# unparseable(count, sample) for value cells normalize_numbers could not read and label_cache(hits, misses)
+# for the distinct labels a classify() call looked up.
+# With no hook installed, stage() hands back a shared no-op context manager.
+_STAGE_HOOK: ContextVar = ContextVar("clearpass_stage_hook", default=None)
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _TimedStage:
+    __slots__ = ("hook", "name", "t0")
+
+    def __init__(self, hook, name):
+        self.hook = hook
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hook.stage(self.name, time.perf_counter() - self.t0)
+        return False
+
+def stage(name: str):
+    hook = _STAGE_HOOK.get()
+    return _NULL_STAGE if hook is None else _TimedStage(hook, name)
+
+def set_stage_hook(hook):
+    """Installs hook for the current context; returns a token for reset_stage_hook."""
+    return _STAGE_HOOK.set(hook)
+
+def reset_stage_hook(token):
+    _STAGE_HOOK.reset(token)
 
 def coalesce(vals):
     for v in vals:
@@ -80,29 +392,19 @@ def coalesce(vals):
             return float(v)
     return np.nan
 
-def parse_financials(input_df: pd.DataFrame, kw_map=None):
-    if kw_map is None:
-        kw_map = default_keywords()
-    df = input_df.copy().dropna(how="all")
-    if df.shape[1] >= 3:
-        try:
-            df = wide_to_long(df)
-        except Exception:
-            df = df.iloc[:, :2]
-            df.columns = ["Account","Value"]
-    else:
-        df.columns = ["Account","Value"]
-    df["Account"] = df["Account"].astype(str)
-    df["Value"] = df["Value"].replace({",":""}, regex=True).replace({"\(":"-", "\)":""}, regex=True)
-    df["Value"] = pd.to_numeric(df["Value"], errors="coerce")
+UNPARSEABLE_SAMPLE = 20
 
-    agg = {k:0.0 for k in kw_map.keys()}
-    for _, row in df.iterrows():
-        tags = match_category(row["Account"], kw_map)
-        for k, hit in tags.items():
-            if hit and pd.notnull(row["Value"]):
-                agg[k] += float(row["Value"])
+def clean_values(values: pd.Series, decimal: str = "auto", scale: float = 1.0) -> pd.Series:
+    """normalize_numbers as a Series; unparseable cells become NaN and are reported to the stage hook."""
+    out, bad = normalize_numbers(values, decimal=decimal, scale=scale)
+    if bad.any():
+        hook = _STAGE_HOOK.get()
+        if hook is not None:
+            sample = [str(v) for v in np.asarray(values, dtype=object)[bad][:UNPARSEABLE_SAMPLE]]
+            hook.unparseable(int(bad.sum()), sample)
+    return pd.Series(out, index=values.index, name=values.name)
 
+def basics_from_agg(agg: Dict[str, float]) -> Dict[str, float]:
     current_assets = coalesce([agg.get('current_assets',0), (agg.get('cash',0)+agg.get('accounts_receivable',0)+agg.get('inventory',0)) if any([agg.get('cash',0),agg.get('accounts_receivable',0),agg.get('inventory',0)]) else None])
     basics = {
         'Revenue': agg.get('revenue') or np.nan,
@@ -127,6 +429,91 @@ def parse_financials(input_df: pd.DataFrame, kw_map=None):
         'Interest Paid': agg.get('interest_paid') or np.nan,
         'Principal Repayment': agg.get('principal_repayment') or np.nan
     }
+    return basics
+
+BASIC_KEYS = list(basics_from_agg({}))
+
+def _to_long(df: pd.DataFrame, decimal: str = "auto", scale: float = 1.0) -> pd.DataFrame:
+    if df.shape[1] >= 3:
+        with stage("wide_to_long"):
+            try:
+                df = wide_to_long(df)
+            except Exception:
+                df = df.iloc[:, :2]
+                df.columns = ["Account","Value"]
+    else:
+        df.columns = ["Account","Value"]
+    df["Account"] = df["Account"].astype(str)
+    with stage("clean_values"):
+        df["Value"] = clean_values(df["Value"], decimal, scale)
+    return df
+
+def parse_financials(input_df: pd.DataFrame, kw_map=None, decimal: str = "auto", scale: float = 1.0):
+    if kw_map is None:
+        kw_map = default_keywords()
+    df = _to_long(input_df.copy().dropna(how="all"), decimal, scale)
+
+    clf = classifier_for(kw_map)
+    with stage("classify"):
+        matrix = clf.classify(df["Account"])
+    with stage("aggregate"):
+        totals = clf.totals(matrix, df["Value"].to_numpy(dtype=float)[:, None])[0]
+        agg = {k: float(v) for k, v in zip(clf.categories, totals)}
+        basics = basics_from_agg(agg)
+    hook = _STAGE_HOOK.get()
+    if hook is not None:
+        hook.rows(len(df), dict(zip(clf.categories, matrix.sum(axis=0).tolist())), int((~matrix.any(axis=1)).sum()))
+    return basics, agg
+
+def parse_financials_stream(chunks: Iterable[pd.DataFrame], kw_map=None, decimal: str = "auto", scale: float = 1.0):
+    """parse_financials over an iterable of row chunks from one statement.
+
+    Each chunk is cleaned, classified and folded into exact per-category running sums, so peak
+    memory is bounded by the chunk size and (basics, agg) equal parse_financials on the whole frame.
+    """
+    if kw_map is None:
+        kw_map = default_keywords()
+    clf = classifier_for(kw_map)
+    sums = [ExactSum() for _ in clf.categories]
+    parsed = unmatched = 0
+    matched = np.zeros(len(clf.categories), dtype=np.int64)
+    for chunk in chunks:
+        chunk = chunk.dropna(how="all")
+        if chunk.empty:
+            continue
+        df = _to_long(chunk.copy(), decimal, scale)
+        with stage("classify"):
+            matrix = clf.classify(df["Account"])
+        with stage("aggregate"):
+            vals = df["Value"].to_numpy(dtype=float)
+            for k, acc in enumerate(sums):
+                acc.add_array(vals[matrix[:, k]])
+        parsed += len(df)
+        matched += matrix.sum(axis=0)
+        unmatched += int((~matrix.any(axis=1)).sum())
+    agg = {k: acc.value for k, acc in zip(clf.categories, sums)}
+    hook = _STAGE_HOOK.get()
+    if hook is not None:
+        hook.rows(parsed, dict(zip(clf.categories, matched.tolist())), unmatched)
+    return basics_from_agg(agg), agg
+
+def parse_financials_multi(input_df: pd.DataFrame, kw_map=None, decimal: str = "auto", scale: float = 1.0):
+    """Parses every fiscal-year column of a wide statement in one pass.
+
+    Account labels are classified once and all year columns are aggregated together.
+    Returns (basics, agg) frames with one row per year column, oldest first.
+    """
+    if kw_map is None:
+        kw_map = default_keywords()
+    df = input_df.dropna(how="all")
+    years = year_columns(df)
+    if not years:
+        raise ValueError("no fiscal-year columns found")
+    values = np.column_stack([clean_values(df[y], decimal, scale).to_numpy(dtype=float) for y in years])
+    clf = classifier_for(kw_map)
+    totals = clf.aggregate_columns(df.iloc[:, 0].astype(str), values)
+    agg = pd.DataFrame(totals, index=pd.Index(years, name="Year"), columns=clf.categories)
+    basics = pd.DataFrame([basics_from_agg(row) for row in agg.to_dict("records")], index=agg.index)
     return basics, agg
 
 def safe_div(a,b):
@@ -157,10 +544,200 @@ def compute_ratios(basics: Dict[str,float]):
     ratios['DSCR (CFO / Debt Service)'] = (None if not denom else round((cfo or 0)/denom, 2))
     return {k: (None if (v is None or (isinstance(v,float) and pd.isna(v))) else round(v,2) if isinstance(v,float) else v) for k,v in ratios.items()}
 
-def benchmark_for(ind_name: str):
-    row = BENCHMARKS[BENCHMARKS['industry_name']==ind_name]
-    if row.empty: row = BENCHMARKS.iloc[[0]]
-    r = row.iloc[0].to_dict()
+RATIO_KEYS = ['Current Ratio', 'Quick Ratio', 'Debt-to-Equity', 'Profit Margin (%)', 'Return on Assets (%)',
+              'Interest Coverage (EBIT)', 'Interest Coverage (EBITDA)', 'Gross Margin (%)', 'Operating Margin (%)',
+              'DSCR (CFO / Debt Service)']
+
+# basics read by each ratio in compute_ratios; a ratio can only move when one of its inputs does.
+RATIO_INPUTS = {
+    'Current Ratio': {'Current Assets', 'Current Liabilities'},
+    'Quick Ratio': {'Cash', 'Accounts Receivable', 'Current Assets', 'Inventory', 'Current Liabilities'},
+    'Debt-to-Equity': {'Total Liabilities', 'Equity'},
+    'Profit Margin (%)': {'Net Income', 'Revenue'},
+    'Return on Assets (%)': {'Net Income', 'Total Assets'},
+    'Interest Coverage (EBIT)': {'EBIT', 'Interest Expense'},
+    'Interest Coverage (EBITDA)': {'EBITDA', 'Interest Expense'},
+    'Gross Margin (%)': {'Revenue', 'COGS'},
+    'Operating Margin (%)': {'EBIT', 'Revenue'},
+    'DSCR (CFO / Debt Service)': {'CFO', 'Principal Repayment', 'Interest Paid', 'Interest Expense'},
+}
+
+def _frame_col(df: pd.DataFrame, key: str):
+    # Absent columns behave like a missing dict key (None) in compute_ratios; present NaNs stay NaN.
+    return pd.to_numeric(df[key], errors="coerce").to_numpy(dtype=float) if key in df.columns else None
+
+def _or0(x, n):
+    return np.zeros(n) if x is None else np.where(x == 0, 0.0, x)
+
+def _truthy(x, n):
+    return np.zeros(n, dtype=bool) if x is None else (x != 0)
+
+def _safe_div_arr(a, b, n):
+    if a is None or b is None:
+        return np.full(n, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(np.isnan(a) | np.isnan(b) | (b == 0), np.nan, a / b)
+
+def _round2(x: np.ndarray) -> np.ndarray:
+    out = np.round(x, 2)
+    scaled = x * 100
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half & np.isfinite(x)):
+        out[i] = round(float(x[i]), 2)
+    return out
+
+def _ratio_arrays(col, n: int) -> Dict[str, np.ndarray]:
+    """compute_ratios over n rows at once, unrounded; col(key) is a basic's array or None when the basic is absent."""
+    ca = col('Current Assets'); cl = col('Current Liabilities')
+    cash = col('Cash'); ar = col('Accounts Receivable'); inv = col('Inventory')
+    tl = col('Total Liabilities'); eq = col('Equity'); ta = col('Total Assets')
+    rev = col('Revenue'); ni = col('Net Income'); cogs = col('COGS')
+    ebit = col('EBIT'); ebitda = col('EBITDA'); int_exp = col('Interest Expense')
+    cfo = col('CFO'); principal = col('Principal Repayment'); interest_paid = col('Interest Paid')
+
+    quick_assets = np.where(_truthy(cash, n) | _truthy(ar, n),
+                            _or0(cash, n) + _or0(ar, n),
+                            _or0(ca, n) - _or0(inv, n))
+    gross = None if rev is None else rev - _or0(cogs, n)
+    ip = np.where(_truthy(interest_paid, n), _or0(interest_paid, n), _or0(int_exp, n))
+    denom = ip + _or0(principal, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dscr = np.where((denom == 0) | np.isnan(denom), np.nan, _or0(cfo, n) / denom)
+    out = {
+        'Current Ratio': _safe_div_arr(ca, cl, n),
+        'Quick Ratio': _safe_div_arr(quick_assets, cl, n),
+        'Debt-to-Equity': _safe_div_arr(tl, eq, n),
+        'Profit Margin (%)': _safe_div_arr(ni, rev, n) * 100,
+        'Return on Assets (%)': _safe_div_arr(ni, ta, n) * 100,
+        'Interest Coverage (EBIT)': _safe_div_arr(ebit, int_exp, n),
+        'Interest Coverage (EBITDA)': _safe_div_arr(ebitda, int_exp, n),
+        'Gross Margin (%)': _safe_div_arr(gross, rev, n) * 100,
+        'Operating Margin (%)': _safe_div_arr(ebit, rev, n) * 100,
+        'DSCR (CFO / Debt Service)': dscr,
+    }
+    return out
+
+def compute_ratios_frame(basics_df: pd.DataFrame) -> pd.DataFrame:
+    out = _ratio_arrays(lambda k: _frame_col(basics_df, k), len(basics_df))
+    return pd.DataFrame({k: _round2(v) for k, v in out.items()}, index=basics_df.index, columns=RATIO_KEYS)
+
+BENCH_METRICS = {
+    'current_ratio': 'Current Ratio',
+    'quick_ratio': 'Quick Ratio',
+    'd_to_e': 'Debt-to-Equity',
+    'profit_margin': 'Profit Margin (%)',
+    'roa': 'Return on Assets (%)',
+}
+
+def _naics_key(code) -> str:
+    if code is None or (isinstance(code, float) and pd.isna(code)):
+        return ""
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    code = str(code).strip()
+    if code.isdigit():
+        return code
+    # "311.0" is how a spreadsheet writes NAICS 311; drop that before keeping the digits.
+    return re.sub(r"\D", "", re.sub(r"\.0+$", "", code))
+
+class BenchmarkStore:
+    """Industry benchmark table indexed by NAICS code (longest-prefix match) and by industry name.
+
+    Metric columns follow '<metric>_<stat>' where metric is a BENCH_METRICS key and stat is
+    'median' or a percentile such as 'p25'/'p75'.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame.reset_index(drop=True)
+        self._by_naics: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        for i, (code, name) in enumerate(zip(self.frame['naics'], self.frame['industry_name'])):
+            self._by_naics.setdefault(_naics_key(code), i)
+            self._by_name.setdefault(norm(name), i)
+        self._by_naics.pop("", None)
+        self.stats = {}
+        for c in self.frame.columns:
+            m = re.match(r"^(.*)_(median|p\d{1,2})$", str(c))
+            if m and m.group(1) in BENCH_METRICS:
+                self.stats.setdefault(m.group(2), {})[BENCH_METRICS[m.group(1)]] = c
+        self._records = self.frame.to_dict("records")
+        self._padded = None
+
+    @classmethod
+    def from_file(cls, path: str) -> "BenchmarkStore":
+        if str(path).lower().endswith((".parquet", ".pq")):
+            return cls(pd.read_parquet(path))
+        return cls(pd.read_csv(path, dtype={'naics': str}))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def names(self) -> List[str]:
+        return self.frame['industry_name'].tolist()
+
+    def find(self, naics=None, name=None):
+        """Row position for a NAICS code (longest known prefix wins) or an industry name, else None."""
+        if naics is not None:
+            key = _naics_key(naics)
+            for n in range(len(key), 1, -1):
+                i = self._by_naics.get(key[:n])
+                if i is not None:
+                    return i
+        if name is not None:
+            return self._by_name.get(norm(name))
+        return None
+
+    def row(self, naics=None, name=None) -> Dict:
+        i = self.find(naics=naics, name=name)
+        if i is None:
+            raise KeyError(f"no benchmark for naics={naics!r} name={name!r}")
+        return self._records[i]
+
+    def benchmark(self, naics=None, name=None, stat: str = "median") -> Dict[str, float]:
+        r = self.row(naics=naics, name=name)
+        return {ratio: r[col] for ratio, col in self.stats.get(stat, {}).items()}
+
+    def percentiles(self, naics=None, name=None) -> Dict[str, Dict[str, float]]:
+        r = self.row(naics=naics, name=name)
+        out: Dict[str, Dict[str, float]] = {}
+        for stat, cols in self.stats.items():
+            for ratio, col in cols.items():
+                out.setdefault(ratio, {})[stat] = r[col]
+        return out
+
+    def lookup_many(self, naics=None, names=None) -> pd.DataFrame:
+        """Benchmark rows aligned with a portfolio's NAICS codes and/or names (NAICS tried first)."""
+        n = len(naics) if naics is not None else len(names)
+        codes = list(naics) if naics is not None else [None] * n
+        labels = list(names) if names is not None else [None] * n
+        missing = len(self.frame)
+        memo: Dict = {}
+        pos = np.empty(n, dtype=np.intp)
+        for j, key in enumerate(zip(codes, labels)):
+            i = memo.get(key)
+            if i is None:
+                i = memo[key] = self.find(naics=key[0], name=key[1])
+                if i is None:
+                    i = memo[key] = missing
+            pos[j] = i
+        if self._padded is None:
+            self._padded = self.frame.reindex(range(missing + 1))
+        return self._padded.iloc[pos].reset_index(drop=True)
+
+_BENCHMARK_STORE = None
+
+def default_benchmark_store() -> BenchmarkStore:
+    global _BENCHMARK_STORE
+    if _BENCHMARK_STORE is None:
+        path = os.environ.get("CLEARPASS_BENCHMARKS")
+        _BENCHMARK_STORE = BenchmarkStore.from_file(path) if path else BenchmarkStore(_benchmarks())
+    return _BENCHMARK_STORE
+
+def benchmark_for(ind_name: str, naics=None):
+    store = default_benchmark_store()
+    i = store.find(naics=naics, name=ind_name)
+    # Legacy behaviour: unknown industries fall back to the first row of the table.
+    r = store._records[0 if i is None else i]
     return {
         'Current Ratio': r['current_ratio_median'],
         'Quick Ratio': r['quick_ratio_median'],
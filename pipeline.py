@@ -0,0 +1,180 @@
+import io
+import os
+import json
+import time
+import zipfile
+import pandas as pd
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+from shared.parsing import parse_financials, parse_financials_stream, compute_ratios, stage, set_stage_hook, reset_stage_hook
+from metrics import StageRecorder
+
+SUPPORTED = (".csv", ".xlsx", ".xls", ".pdf")
+STREAMABLE = (".csv", ".xlsx", ".xlsm")
+STREAM_THRESHOLD = int(float(os.environ.get("CLEARPASS_STREAM_THRESHOLD_MB", "64")) * 2**20)
+CHUNK_ROWS = int(os.environ.get("CLEARPASS_CHUNK_ROWS", "100000"))
+
+def read_upload(name: str, data: bytes, pdf_options: Dict = None) -> pd.DataFrame:
+    """pdf_options (see pdf_read_options) go to extract_tables_to_long; other formats ignore them."""
+    lower = name.lower()
+    if lower.endswith(".csv"):
+        return pd.read_csv(io.BytesIO(data))
+    if lower.endswith(".pdf"):
+        from parser_pdf import extract_tables_to_long
+        return extract_tables_to_long(io.BytesIO(data), **(pdf_options or {}))
+    return pd.read_excel(io.BytesIO(data))
+
+def pdf_read_options(pages=None, stop_when_found: bool = False) -> Optional[Dict]:
+    """Validated PDF extraction options for read_upload, or None for the defaults (every page).
+
+    pages is a page-range hint ("3-12" or 1-based page numbers); raises ValueError if it is malformed.
+    """
+    from parser_pdf import parse_page_ranges
+    pages = parse_page_ranges(pages or None)
+    if pages is None and not stop_when_found:
+        return None
+    return {"pages": pages, "stop_when_found": bool(stop_when_found)}
+
+def _xlsx_empty(v) -> bool:
+    return v is None or v == ""
+
+def _xlsx_width(source) -> int:
+    """Columns pd.read_excel keeps: up to the last cell with a value in any row, header included."""
+    from openpyxl import load_workbook
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        width = 0
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            for i in range(len(row) - 1, width - 1, -1):
+                if not _xlsx_empty(row[i]):
+                    width = i + 1
+                    break
+        return width
+    finally:
+        wb.close()
+
+def _xlsx_columns(header, width: int) -> List:
+    header = tuple(header[:width]) + (None,) * (width - len(header))
+    cols, seen = [], {}
+    for i, c in enumerate(header):
+        c = f"Unnamed: {i}" if _xlsx_empty(c) else c
+        n = seen.get(c, 0)
+        seen[c] = n + 1
+        cols.append(c if n == 0 else f"{c}.{n}")
+    return cols
+
+def _iter_xlsx_chunks(source, chunksize: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+    # The width depends on every row, so it takes a pass of its own; memory stays flat either way.
+    start = None if isinstance(source, (str, os.PathLike)) else source.tell()
+    width = _xlsx_width(source)
+    if start is not None:
+        source.seek(start)
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        cols = _xlsx_columns(header, width)
+        buf = []
+        for row in rows:
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            buf.append(row)
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=cols)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=cols)
+    finally:
+        wb.close()
+
+def iter_upload_chunks(name: str, source, chunksize: int = CHUNK_ROWS, pdf_options: Dict = None) -> Iterator[pd.DataFrame]:
+    """Row chunks of a CSV/XLSX upload (path or file object); other formats come back as one frame."""
+    lower = name.lower()
+    if lower.endswith(".csv"):
+        with pd.read_csv(source, chunksize=chunksize) as reader:
+            yield from reader
+    elif lower.endswith((".xlsx", ".xlsm")):
+        yield from _iter_xlsx_chunks(source, chunksize)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            yield read_upload(name, fh.read(), pdf_options)
+    else:
+        yield read_upload(name, source.read(), pdf_options)
+
+def jsonable(d: Dict) -> Dict:
+    return {k: (None if (v is None or (isinstance(v, float) and np.isnan(v))) else v) for k, v in d.items()}
+
+def analyze_bytes(name: str, data: bytes, instrument: bool = False, pdf_options: Dict = None) -> Dict:
+    # The recorder always runs so unparseable value cells are reported; timings are opt-in.
+    recorder = StageRecorder()
+    token = set_stage_hook(recorder)
+    try:
+        with stage("read"):
+            df = read_upload(name, data, pdf_options)
+        basics, _ = parse_financials(df)
+        with stage("compute_ratios"):
+            ratios = compute_ratios(basics)
+    finally:
+        reset_stage_hook(token)
+    out = {"basics": jsonable(basics), "ratios": ratios, "unparseable": recorder.unparseable_report()}
+    if instrument:
+        out["timings"] = recorder.breakdown()
+    return out
+
+def analyze_path(name: str, path: str, instrument: bool = False, chunksize: int = CHUNK_ROWS,
+                 pdf_options: Dict = None) -> Dict:
+    """Analyzes an upload spooled to disk, streaming it in chunks when it is large enough to matter."""
+    if os.path.getsize(path) <= STREAM_THRESHOLD or not name.lower().endswith(STREAMABLE):
+        with open(path, "rb") as fh:
+            return analyze_bytes(name, fh.read(), instrument, pdf_options)
+    recorder = StageRecorder()
+    token = set_stage_hook(recorder)
+    try:
+        basics, _ = parse_financials_stream(iter_upload_chunks(name, path, chunksize))
+        with stage("compute_ratios"):
+            ratios = compute_ratios(basics)
+    finally:
+        reset_stage_hook(token)
+    out = {"basics": jsonable(basics), "ratios": ratios, "unparseable": recorder.unparseable_report()}
+    if instrument:
+        out["timings"] = recorder.breakdown()
+    return out
+
+def cache_kind(filename: str, pdf_options: Dict = None, prefix: str = "analysis") -> str:
+    """Result cache kind for an upload; PDFs read with non-default options are cached apart."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".pdf" and pdf_options:
+        return f"{prefix}{ext}:{json.dumps(pdf_options, sort_keys=True)}"
+    return prefix + ext
+
+def _outcome(name: str, analyze, source, instrument: bool, pdf_options: Dict = None) -> Dict:
+    t0 = time.perf_counter()
+    try:
+        out = {"file": name, "ok": True, **analyze(name, source, instrument, pdf_options=pdf_options), "error": None}
+    except Exception as e:
+        out = {"file": name, "ok": False, "basics": None, "ratios": None, "unparseable": None, "error": f"{type(e).__name__}: {e}"}
+    out["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return out
+
+def analyze_file(name: str, data: bytes, instrument: bool = False, pdf_options: Dict = None) -> Dict:
+    return _outcome(name, analyze_bytes, data, instrument, pdf_options)
+
+def analyze_file_path(name: str, path: str, instrument: bool = False, pdf_options: Dict = None) -> Dict:
+    return _outcome(name, analyze_path, path, instrument, pdf_options)
+
+def expand_uploads(items: List[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    out = []
+    for name, data in items:
+        if not name.lower().endswith(".zip"):
+            out.append((name, data))
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for info in zf.infolist():
+                member = info.filename
+                if info.is_dir() or member.startswith("__MACOSX/") or os.path.basename(member).startswith("."):
+                    continue
+                if member.lower().endswith(SUPPORTED):
+                    out.append((f"{name}/{member}", zf.read(info)))
+    return out
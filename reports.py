@@ -0,0 +1,206 @@
+import io
+import os
+import json
+import re
+import hashlib
+import textwrap
+import threading
+import unicodedata
+from urllib.parse import quote
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Dict, Optional
+import pandas as pd
+from result_cache import MemoryTier
+
+REPORT_FORMATS = ("pdf", "docx")
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+def underwriting_memo(company, year, industry, basics, ratios, bench):
+    def fmt(val):
+        if val is None or (isinstance(val,float) and pd.isna(val)): return 'n/a'
+        try: return f'{float(val):,.0f}'
+        except: return str(val)
+    def rfmt(val, pct=False):
+        if val is None or (isinstance(val,float) and pd.isna(val)): return 'n/a'
+        return f'{val:,.2f}{ "%" if pct else "" }'
+    sections = []
+    sections.append(f'Underwriting Memo — {company} (FY {year})')
+    sections.append(f'Industry: {industry}')
+    sections.append('—'*60)
+    cr = ratios.get('Current Ratio'); qr = ratios.get('Quick Ratio')
+    de = ratios.get('Debt-to-Equity'); pm = ratios.get('Profit Margin (%)'); roa = ratios.get('Return on Assets (%)')
+    cov = ratios.get('Interest Coverage (EBIT)') or ratios.get('Interest Coverage (EBITDA)')
+    dscr = ratios.get('DSCR (CFO / Debt Service)')
+    es = [
+        f'Liquidity: Current {rfmt(cr)} (bench {bench["Current Ratio"]}), Quick {rfmt(qr)} (bench {bench["Quick Ratio"]}).',
+        f'Leverage: D/E {rfmt(de)} (bench {bench["Debt-to-Equity"]}).',
+        f'Profitability: Margin {rfmt(pm,True)} (bench {bench["Profit Margin (%)"]}%), ROA {rfmt(roa,True)} (bench {bench["Return on Assets (%)"]}%).',
+        f'Coverage: Interest coverage ≈ {rfmt(cov)}x (target ≥3x).',
+        f'DSCR: {rfmt(dscr)}x (preferred ≥1.25x)'
+    ]
+    sections.append('Executive Summary'); sections.append('\n'.join(es))
+    fs = [
+        f'Revenue: {fmt(basics.get("Revenue"))}',
+        f'COGS: {fmt(basics.get("COGS"))}',
+        f'Operating Expenses: {fmt(basics.get("Operating Expenses"))}',
+        f'EBIT: {fmt(basics.get("EBIT"))}',
+        f'EBITDA: {fmt(basics.get("EBITDA"))}',
+        f'Net Income: {fmt(basics.get("Net Income"))}',
+        f'Cash: {fmt(basics.get("Cash"))} | AR: {fmt(basics.get("Accounts Receivable"))} | Inventory: {fmt(basics.get("Inventory"))}',
+        f'Current Assets: {fmt(basics.get("Current Assets"))} | Current Liabilities: {fmt(basics.get("Current Liabilities"))}',
+        f'Total Liabilities: {fmt(basics.get("Total Liabilities"))} | Equity: {fmt(basics.get("Equity"))} | Total Assets: {fmt(basics.get("Total Assets"))}',
+        f'CFO: {fmt(basics.get("CFO"))} | Interest Paid: {fmt(basics.get("Interest Paid"))} | Principal Repayment: {fmt(basics.get("Principal Repayment"))}',
+        f'Interest Expense: {fmt(basics.get("Interest Expense"))}'
+    ]
+    sections.append('Financial Snapshot'); sections.append('\n'.join(fs))
+    def lvl_de(d): 
+        if d is None: return 'n/a'
+        return 'conservative' if d<=1.0 else ('moderate' if d<=2.0 else 'elevated')
+    cv = [
+        f'Liquidity is {"strong" if cr and cr>=1.8 else ("acceptable" if cr and cr>=1.2 else "weak")} with working capital cover {rfmt(cr)}x.',
+        f'Leverage is {lvl_de(de)} at D/E {rfmt(de)} relative to industry median {bench["Debt-to-Equity"]}.',
+        f'Debt service capacity is {"adequate" if (cov is not None and cov>=3) else ("tight" if cov is not None else "n/a")} with coverage ≈ {rfmt(cov)}x; DSCR {rfmt(dscr)}x.',
+        f'Profitability (margin {rfmt(pm,True)}, ROA {rfmt(roa,True)}) {"outperform" if (pm and pm>bench["Profit Margin (%)"]) else ("align with" if (pm and abs(pm-bench["Profit Margin (%)"])<=2) else "trail")} industry median.'
+    ]
+    sections.append('Credit View'); sections.append('\n'.join(cv))
+    risks = [
+        'Revenue/customer concentration may pressure cash flow in a downturn.',
+        'Working capital strain if AR days extend or inventory turns slow.',
+        'Exposure to rising rates on floating debt.'
+    ]
+    mitigants = [
+        'Stable gross margins and positive CFO trend.',
+        'Cash buffer; ability to flex SG&A if needed.',
+        'Leverage within sector norms; coverage acceptable on base case.'
+    ]
+    sections.append('Key Risks'); sections.append('\n'.join([f'- {r}' for r in risks]))
+    sections.append('Mitigants'); sections.append('\n'.join([f'- {m}' for m in mitigants]))
+    sections.append('Indicative Decision Framework')
+    dec = [
+        '• Approve with standard terms if: D/E ≤ 1.5x and Interest coverage ≥ 3x and Current ratio ≥ 1.2x and DSCR ≥ 1.25x.',
+        '• Approve with conditions (e.g., LOC) if: coverage 2.0–3.0x or current ratio 1.0–1.2x or DSCR 1.0–1.25x.',
+        '• Decline or require collateral if: coverage < 2.0x or DSCR < 1.0x or severe liquidity stress.'
+    ]
+    sections.append('\n'.join(dec))
+    return '\n\n'.join(sections)
+
+def render_pdf(company, year, industry, basics, ratios, bench) -> bytes:
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+    from matplotlib.backends.backend_pdf import PdfPages
+    buf = io.BytesIO()
+    with PdfPages(buf) as pdf:
+        fig = Figure(figsize=(8.27, 11.69))
+        ax = fig.add_axes([0,0,1,1]); ax.axis("off")
+        ax.add_patch(Rectangle((0,0.93), 1,0.07, transform=ax.transAxes))
+        ax.text(0.30, 0.965, 'ClearPass — Underwriting Report', fontsize=18, weight='bold', transform=ax.transAxes, va='center')
+        ax.text(0.08, 0.84, company, fontsize=24, weight='bold')
+        ax.text(0.08, 0.80, f'Fiscal Year: {year}', fontsize=11)
+        ax.text(0.08, 0.77, f'Industry: {industry}', fontsize=11)
+        pdf.savefig(fig)
+        fig = Figure(figsize=(8.27, 11.69))
+        ax = fig.add_axes([0.08,0.12,0.84,0.78]); ax.axis("off")
+        ax.set_title("Key Ratios & Benchmarks", loc="left", fontsize=16, pad=10)
+        rows = [
+            ("Current Ratio", ratios.get("Current Ratio"), bench["Current Ratio"]),
+            ("Quick Ratio", ratios.get("Quick Ratio"), bench["Quick Ratio"]),
+            ("Debt-to-Equity", ratios.get("Debt-to-Equity"), bench["Debt-to-Equity"]),
+            ("Profit Margin (%)", ratios.get("Profit Margin (%)"), bench["Profit Margin (%)"]),
+            ("Return on Assets (%)", ratios.get("Return on Assets (%)"), bench["Return on Assets (%)"]),
+            ("Interest Coverage (EBIT)", ratios.get("Interest Coverage (EBIT)"), "≥3.0x target"),
+            ("Interest Coverage (EBITDA)", ratios.get("Interest Coverage (EBITDA)"), "≥3.0x target"),
+            ("DSCR (CFO / Debt Service)", ratios.get("DSCR (CFO / Debt Service)"), "≥1.25x preferred"),
+        ]
+        y=0.95
+        for name, val, b in rows:
+            ax.text(0.02,y,f"{name}", fontsize=11)
+            ax.text(0.55,y,f"{'n/a' if (val is None) else round(val,2)}", fontsize=11)
+            ax.text(0.78,y,f"{'' if (b is None) else b}", fontsize=11)
+            y -= 0.06
+        pdf.savefig(fig)
+        memo = underwriting_memo(company, year, industry, basics, ratios, bench)
+        fig = Figure(figsize=(8.27, 11.69))
+        ax = fig.add_axes([0.08,0.08,0.84,0.84]); ax.axis("off")
+        ax.set_title("Underwriting Memo", loc="left", fontsize=16, pad=10)
+        wrapped = textwrap.fill(memo, 110)
+        ax.text(0,1, wrapped, va="top", fontsize=10)
+        pdf.savefig(fig)
+    return buf.getvalue()
+
+def render_docx(company, year, industry, basics, ratios, bench) -> bytes:
+    from export_docx import memo_to_docx
+    buf = io.BytesIO()
+    memo_to_docx(underwriting_memo(company, year, industry, basics, ratios, bench), buf)
+    return buf.getvalue()
+
+def render_report(fmt: str, company, year, industry, basics, ratios, bench) -> bytes:
+    if fmt == "pdf":
+        return render_pdf(company, year, industry, basics, ratios, bench)
+    if fmt == "docx":
+        return render_docx(company, year, industry, basics, ratios, bench)
+    raise ValueError(f"unsupported report format: {fmt!r}")
+
+def report_filename(fmt: str, company) -> str:
+    # Control characters, quotes and path separators have no place in a download name or header.
+    company = re.sub(r'[\x00-\x1f\x7f"\\/]', "", str(company))
+    return f"{company}_Underwriting_Report.pdf" if fmt == "pdf" else f"{company}_Underwriting_Memo.docx"
+
+def content_disposition(filename: str) -> str:
+    """attachment header with an ASCII fallback name plus the RFC 5987 UTF-8 form for non-Latin names."""
+    ascii_name = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+    ascii_name = re.sub(r'[\x00-\x1f\x7f"\\]', "", ascii_name) or "report"
+    return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+def report_key(fmt: str, company, year, industry, basics, ratios, bench) -> str:
+    blob = json.dumps([fmt, company, year, industry, basics, ratios, bench], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class ReportRenderer:
+    """Renders reports in a worker pool and keeps the rendered bytes keyed on their inputs."""
+
+    def __init__(self, executor: Optional[Executor] = None, cache: Optional[MemoryTier] = None):
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="clearpass-render")
+        self.cache = cache if cache is not None else MemoryTier(int(float(os.environ.get("CLEARPASS_REPORT_CACHE_MB", "64")) * 2**20))
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fmt: str, company, year, industry, basics, ratios, bench) -> Future:
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"unsupported report format: {fmt!r}")
+        key = report_key(fmt, company, year, industry, basics, ratios, bench)
+        cached = self.cache.get(key)
+        if cached is not None:
+            fut = Future(); fut.set_result(cached)
+            return fut
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                return fut
+            fut = self.executor.submit(render_report, fmt, company, year, industry, basics, ratios, bench)
+            self._inflight[key] = fut
+        # Registered outside the lock: a future that is already done runs the callback right here,
+        # and _store takes the lock itself.
+        fut.add_done_callback(lambda f, key=key: self._store(key, f))
+        return fut
+
+    def render(self, fmt: str, company, year, industry, basics, ratios, bench) -> bytes:
+        return self.submit(fmt, company, year, industry, basics, ratios, bench).result()
+
+    def _store(self, key: str, fut: Future):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if not fut.cancelled() and fut.exception() is None:
+            self.cache.put(key, fut.result())
+
+_default = None
+_default_lock = threading.Lock()
+
+def default_renderer() -> ReportRenderer:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ReportRenderer()
+        return _default
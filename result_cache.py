@@ -0,0 +1,182 @@
+import io
+import os
+import json
+import time
+import stat
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+import pandas as pd
+from shared.parsing import keywords_fingerprint, default_keywords
+
+# Bump when parsing/ratio logic changes so stale on-disk entries are never served.
+RESULT_VERSION = "2"
+
+class MemoryTier:
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+class SQLiteTier:
+    def __init__(self, path: str, max_bytes: int = 512 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            con.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock, self._connect() as con:
+            row = con.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            con.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, value: str):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock, self._connect() as con:
+            con.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                        (key, value, len(value), time.time()))
+            total = con.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = con.execute("SELECT key, size FROM results ORDER BY accessed LIMIT 64").fetchall()
+                if not oldest:
+                    break
+                for k, size in oldest:
+                    con.execute("DELETE FROM results WHERE key = ?", (k,))
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+
+    def clear(self):
+        with self._lock, self._connect() as con:
+            con.execute("DELETE FROM results")
+
+class ResultCache:
+    """Read-through cache over a list of tiers (fastest first); values are stored as JSON text."""
+
+    def __init__(self, tiers: List):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, data: bytes, kind: str = "analysis", kw_map: Dict[str, List[str]] = None) -> str:
+        return self.key_for_digest(hashlib.sha256(data).hexdigest(), kind, kw_map)
+
+    def key_for_digest(self, digest: str, kind: str = "analysis", kw_map: Dict[str, List[str]] = None) -> str:
+        kw = keywords_fingerprint(default_keywords() if kw_map is None else kw_map)
+        return f"{kind}:{RESULT_VERSION}:{kw}:{digest}"
+
+    def get(self, key: str) -> Any:
+        for i, tier in enumerate(self.tiers):
+            raw = tier.get(key)
+            if raw is not None:
+                for faster in self.tiers[:i]:
+                    faster.put(key, raw)
+                self.hits += 1
+                return json.loads(raw)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        raw = json.dumps(value)
+        for tier in self.tiers:
+            tier.put(key, raw)
+
+    def get_or_compute(self, key: str, fn: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+def frame_to_json(df: pd.DataFrame) -> str:
+    return df.to_json(orient="split", date_format="iso")
+
+def frame_from_json(raw: str) -> pd.DataFrame:
+    return pd.read_json(io.StringIO(raw), orient="split", dtype=False, convert_axes=False, convert_dates=False)
+
+_default = None
+_default_lock = threading.Lock()
+
+def _private_dir() -> Optional[str]:
+    """<tempdir>/clearpass-<uid>, created mode 0700; None if it exists but is not ours alone."""
+    path = os.path.join(tempfile.gettempdir(), f"clearpass-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        return None
+    return path
+
+def default_cache() -> ResultCache:
+    """Process-wide cache configured from CLEARPASS_CACHE_* env vars; set CLEARPASS_CACHE_PATH='' for memory only.
+
+    The disk tier defaults to a per-user directory only its owner can read, since cached results hold
+    borrowers' figures; if that directory is not private the cache stays in memory.
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            mb = lambda name, dflt: int(float(os.environ.get(name, dflt)) * 2**20)
+            tiers = [MemoryTier(mb("CLEARPASS_CACHE_MEMORY_MB", "64"))]
+            path = os.environ.get("CLEARPASS_CACHE_PATH")
+            if path is None:
+                private = _private_dir()
+                path = os.path.join(private, "results.sqlite") if private else ""
+            if path:
+                tiers.append(SQLiteTier(path, mb("CLEARPASS_CACHE_DISK_MB", "512")))
+            _default = ResultCache(tiers)
+        return _default
@@ -0,0 +1,273 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from shared.parsing import BASIC_KEYS, RATIO_KEYS
+try:
+    import fcntl
+except ImportError:  # no advisory file locks (Windows): single-process use only
+    fcntl = None
+
+# Fixed column order of every stored row; appending a metric means a new format version.
+METRICS = BASIC_KEYS + RATIO_KEYS
+FORMAT_VERSION = 1
+INDEX_DTYPE = np.dtype([("borrower", "<i4"), ("year", "<i4")])
+# append compacts once the rows written since the last compact reach this many and this share of the store.
+COMPACT_MIN_ROWS = int(os.environ.get("CLEARPASS_STORE_COMPACT_ROWS", "10000"))
+COMPACT_RATIO = float(os.environ.get("CLEARPASS_STORE_COMPACT_RATIO", "0.25"))
+
+class StatementStore:
+    """Columnar, append-only store of parsed basics and ratios keyed by (borrower, fiscal year).
+
+    A directory holding values.<gen>.bin (rows of len(METRICS) little-endian floats), index.<gen>.bin
+    ((borrower id, year) per row), borrowers.txt (one name per id) and meta.json. Appends write
+    to the end of the files; reads memory-map the values file, and selections whose rows are
+    contiguous (a borrower, a borrower's years, a range of borrowers after compact()) come back
+    as views on the map without copying. A later row for the same (borrower, year) supersedes
+    earlier ones until compact() drops them; append() compacts by itself once enough unsorted rows
+    pile up (COMPACT_MIN_ROWS / COMPACT_RATIO). Writers in several processes serialize on an fcntl
+    lock over the store's lock file, and readers follow a compact() done elsewhere.
+    """
+
+    def __init__(self, path: str, dtype: str = "float64"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._meta_stamp = None
+        self._borrowers_size = None
+        self._view = None
+        os.makedirs(path, exist_ok=True)
+        with self._file_lock():
+            if os.path.exists(self._file("meta.json")):
+                self._sync()
+            else:
+                self.dtype = np.dtype(dtype).newbyteorder("<")
+                if self.dtype.kind != "f" or self.dtype.itemsize not in (4, 8):
+                    raise ValueError("dtype must be float32 or float64")
+                self.generation = 0
+                self.sorted_rows = 0
+                for name in ("values.0.bin", "index.0.bin", "borrowers.txt"):
+                    open(os.path.join(path, name), "ab").close()
+                self._write_meta()
+                self._sync()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.path, "lock"), "a") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Picks up a new generation (compact() in another process) and borrowers added elsewhere."""
+        st = os.stat(self._file("meta.json"))
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp != self._meta_stamp:
+            with open(self._file("meta.json")) as fh:
+                meta = json.load(fh)
+            if meta["version"] != FORMAT_VERSION or meta["metrics"] != METRICS:
+                raise ValueError(f"{self.path} was written with a different statement store format")
+            self.dtype = np.dtype(meta["dtype"])
+            self.generation = meta["generation"]
+            self.sorted_rows = meta.get("sorted_rows", 0)
+            self._meta_stamp = stamp
+            self._view = None
+        if os.path.getsize(self._file("borrowers.txt")) != self._borrowers_size:
+            self._load_borrowers()
+
+    def _load_borrowers(self):
+        with open(self._file("borrowers.txt"), "rb") as fh:
+            raw = fh.read()
+        self._borrowers_size = len(raw)
+        self.borrowers: List[str] = raw.decode("utf-8").splitlines()
+        self._ids = {b: i for i, b in enumerate(self.borrowers)}
+
+    def _file(self, name: str) -> str:
+        if name in ("values", "index"):
+            name = f"{name}.{self.generation}.bin"
+        return os.path.join(self.path, name)
+
+    def _write_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as fh:
+            json.dump({"version": FORMAT_VERSION, "metrics": METRICS, "dtype": self.dtype.str, "generation": self.generation,
+                       "sorted_rows": self.sorted_rows}, fh)
+        os.replace(tmp, self._file("meta.json"))
+
+    def __len__(self) -> int:
+        # The index is written after the values, so it decides how many rows are committed.
+        return os.path.getsize(self._file("index")) // INDEX_DTYPE.itemsize
+
+    def append(self, borrower: str, fiscal_year: int, basics: Dict, ratios: Dict = None):
+        self.append_many([(borrower, fiscal_year, basics, ratios or {})])
+
+    def append_many(self, records: Iterable[Tuple[str, int, Dict, Dict]]):
+        """Appends (borrower, fiscal_year, basics, ratios) records; missing/None metrics are stored as NaN.
+
+        Every record is validated before anything is written, so a bad one leaves the store untouched.
+        """
+        records = list(records)
+        if not records:
+            return
+        values = np.full((len(records), len(METRICS)), np.nan, dtype=self.dtype)
+        years = np.empty(len(records), dtype=INDEX_DTYPE["year"])
+        names = []
+        for r, (borrower, year, basics, ratios) in enumerate(records):
+            # borrowers.txt is read back with splitlines(), so any line break would shift every later id.
+            if not isinstance(borrower, str) or (borrower and borrower.splitlines() != [borrower]):
+                raise ValueError(f"borrower ids must be strings without line breaks: {borrower!r}")
+            year = int(year)
+            if not np.iinfo(years.dtype).min <= year <= np.iinfo(years.dtype).max:
+                raise ValueError(f"fiscal year out of range: {year}")
+            merged = {**basics, **(ratios or {})}
+            try:
+                values[r] = [np.nan if merged.get(k) is None else float(merged[k]) for k in METRICS]
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"non-numeric metric for {borrower!r} {year}: {e}") from None
+            years[r] = year
+            names.append(borrower)
+        with self._lock, self._file_lock():
+            # Ids and the write offset are only stable under the file lock, after catching up with other writers.
+            self._sync()
+            new: Dict[str, int] = {}
+            index = np.empty(len(records), dtype=INDEX_DTYPE)
+            for r, borrower in enumerate(names):
+                bid = self._ids.get(borrower)
+                if bid is None:
+                    bid = new.get(borrower)
+                if bid is None:
+                    bid = new[borrower] = len(self.borrowers) + len(new)
+                index[r] = (bid, years[r])
+            if new:
+                text = "".join(b + "\n" for b in new).encode("utf-8")
+                with open(self._file("borrowers.txt"), "ab") as fh:
+                    fh.write(text)
+            # A reader that sees an index row can always find its values.
+            with open(self._file("values"), "r+b") as fh:
+                fh.seek(len(self) * len(METRICS) * self.dtype.itemsize)
+                fh.write(values.tobytes())
+            with open(self._file("index"), "ab") as fh:
+                fh.write(index.tobytes())
+            # Only now that the rows are on disk do the new ids become part of this instance's view.
+            if new:
+                self.borrowers.extend(new)
+                self._ids.update(new)
+                self._borrowers_size += len(text)
+            self._view = None
+            n = len(self)
+            if n - self.sorted_rows >= max(COMPACT_MIN_ROWS, COMPACT_RATIO * n):
+                self._compact()
+
+    def append_frame(self, borrower: str, frame: pd.DataFrame):
+        """Appends a per-year frame such as parse_financials_multi basics joined with compute_ratios_frame."""
+        cols = [c for c in METRICS if c in frame.columns]
+        records = [(borrower, int(y), dict(zip(cols, row)), {}) for y, row in zip(frame.index, frame[cols].to_numpy(dtype=float).tolist())]
+        self.append_many(records)
+
+    def _state(self):
+        """(values memmap, index array, live row numbers sorted by borrower name then year)."""
+        try:
+            return self._load()
+        except FileNotFoundError:
+            # Another process compacted between reading meta.json and opening the old generation.
+            self._meta_stamp = None
+            return self._load()
+
+    def _load(self):
+        self._sync()
+        n = len(self)
+        if self._view is not None and self._view[0] == n:
+            return self._view[1:]
+        if n == 0:
+            values = np.empty((0, len(METRICS)), dtype=self.dtype)
+            index = np.empty(0, dtype=INDEX_DTYPE)
+        else:
+            values = np.memmap(self._file("values"), dtype=self.dtype, mode="r", shape=(n, len(METRICS)))
+            index = np.fromfile(self._file("index"), dtype=INDEX_DTYPE, count=n)
+        if len(self.borrowers) <= (index["borrower"].max() if n else -1):
+            self._load_borrowers()
+        rank = np.empty(len(self.borrowers), dtype=np.int64)
+        rank[np.argsort(np.array(self.borrowers, dtype=object), kind="stable")] = np.arange(len(self.borrowers))
+        rows = np.arange(n)
+        # Sort by (borrower name, year, row) and keep the last row of each (borrower, year).
+        order = np.lexsort((rows, index["year"], rank[index["borrower"]] if n else rows))
+        keys = index[order]
+        last = np.ones(n, dtype=bool)
+        last[:-1] = (keys["borrower"][1:] != keys["borrower"][:-1]) | (keys["year"][1:] != keys["year"][:-1])
+        live = order[last]
+        self._rank = rank
+        self._live_rank = rank[index["borrower"][live]] if n else np.empty(0, dtype=np.int64)
+        self._view = (n, values, index, live)
+        return values, index, live
+
+    def select(self, borrowers: Sequence[str] = None, years: Tuple[int, int] = None):
+        """Returns (values, index) for the live rows of the given borrowers and inclusive year range.
+
+        values is a view on the memory map when those rows are stored contiguously and in order,
+        otherwise a gathered copy; index holds (borrower id, year) per row.
+        """
+        values, index, live = self._state()
+        rows = live
+        if borrowers is not None:
+            # live is ordered by borrower name, so each borrower is one run found by bisection.
+            ranks = np.unique(self._rank[[self._ids[b] for b in borrowers if b in self._ids]])
+            lo = np.searchsorted(self._live_rank, ranks, "left")
+            hi = np.searchsorted(self._live_rank, ranks, "right")
+            rows = np.concatenate([live[a:b] for a, b in zip(lo, hi)] or [live[:0]])
+        if years is not None:
+            y = index["year"][rows]
+            rows = rows[(y >= years[0]) & (y <= years[1])]
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and np.all(np.diff(rows) == 1):
+            return np.asarray(values[rows[0]:rows[-1] + 1]), index[rows[0]:rows[-1] + 1]
+        return np.asarray(values[rows]), index[rows]
+
+    def frame(self, borrowers: Sequence[str] = None, years: Tuple[int, int] = None) -> pd.DataFrame:
+        """select() as a DataFrame indexed by (Borrower, Year) with METRICS columns, sharing memory where select() does."""
+        values, index = self.select(borrowers, years)
+        names = np.array(self.borrowers, dtype=object)[index["borrower"]] if len(index) else np.array([], dtype=object)
+        idx = pd.MultiIndex.from_arrays([names, index["year"]], names=["Borrower", "Year"])
+        return pd.DataFrame(values, index=idx, columns=METRICS, copy=False)
+
+    def history(self, borrower: str) -> pd.DataFrame:
+        return self.frame([borrower]).droplevel("Borrower")
+
+    def compact(self):
+        """Rewrites the store sorted by (borrower, year) without superseded rows, so borrower slices are contiguous.
+
+        The rewrite goes to a new generation of files that meta.json switches to atomically; stores
+        open in other processes follow it on their next read.
+        """
+        with self._lock, self._file_lock():
+            self._compact()
+
+    def _compact(self):
+        values, index, live = self._state()
+        old = (self._file("values"), self._file("index"))
+        self.generation += 1
+        self.sorted_rows = len(live)
+        np.asarray(values[live]).tofile(self._file("values"))
+        index[live].tofile(self._file("index"))
+        self._write_meta()
+        self._sync()
+        for path in old:
+            os.unlink(path)
+
+_default = None
+_default_lock = threading.Lock()
+
+def default_statement_store() -> Optional[StatementStore]:
+    """Store at CLEARPASS_STORE_PATH (CLEARPASS_STORE_DTYPE float64/float32); None when the path is unset."""
+    global _default
+    path = os.environ.get("CLEARPASS_STORE_PATH")
+    if not path:
+        return None
+    with _default_lock:
+        if _default is None or _default.path != path:
+            _default = StatementStore(path, os.environ.get("CLEARPASS_STORE_DTYPE", "float64"))
+        return _default
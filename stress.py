@@ -0,0 +1,160 @@
+from typing import Dict, Mapping, Optional
+import numpy as np
+import pandas as pd
+from shared.parsing import RATIO_KEYS, _ratio_arrays, _round2, compute_ratios
+
+SHOCKS = ("revenue", "rate_bp", "ar_days")
+
+# Standard-terms tests from underwriting_memo's decision framework; a scenario breaches a test
+# when the ratio is defined and falls on the wrong side of the limit.
+DECISION_THRESHOLDS = {
+    'Debt-to-Equity': ('max', 1.5),
+    'Interest Coverage (EBIT)': ('min', 3.0),
+    'Current Ratio': ('min', 1.2),
+    'DSCR (CFO / Debt Service)': ('min', 1.25),
+}
+
+STRESS_SCENARIOS = {
+    'Revenue -20%': {'revenue': -0.20},
+    'Rates +300bp': {'rate_bp': 300},
+    'AR days +30': {'ar_days': 30},
+    'Combined': {'revenue': -0.20, 'rate_bp': 300, 'ar_days': 30},
+}
+
+STRESS_PERCENTILES = (5, 25, 50, 75, 95)
+
+def _shift(x, d):
+    # A basic that was never reported stays absent.
+    return None if x is None else x + d
+
+def _add(x, d):
+    # Cost and receivable lines a shock can create; compute_ratios reads an absent one like 0,
+    # and unshocked scenarios keep the reported value, NaN included.
+    if x is None:
+        return d if np.any(d) else None
+    return np.where(d != 0, np.where(np.isnan(x), 0.0, x) + d, x)
+
+def stressed_basics(basics: Mapping, revenue=0.0, rate_bp=0.0, ar_days=0.0, floating_share: float = 1.0) -> Dict:
+    """Basics under shocks that broadcast against each other, as arrays (None where the basic is absent).
+
+    revenue: relative change in Revenue; COGS moves with it and operating expenses stay fixed, so
+    EBIT, EBITDA, Net Income and CFO lose the gross profit given up.
+    rate_bp: basis points added to the rate on debt (Short- plus Long-term Debt, else Total
+    Liabilities) times floating_share; the extra interest hits Interest Expense/Paid, Net Income and CFO.
+    ar_days: extra days of (stressed) revenue tied up in receivables, funded from cash, which cuts CFO.
+    Earnings are taken pre-tax, and lost earnings come out of Cash, Current/Total Assets and Equity.
+    Missing values keep compute_ratios' meaning: NaN (parse_financials' missing line) stays NaN and None
+    or an absent key stays absent.
+    """
+    b = {k: None if v is None else np.float64(v) for k, v in basics.items()}
+    rev, cogs = b.get('Revenue'), b.get('COGS')
+    revenue = np.maximum(np.asarray(revenue, dtype=float), -1.0)
+    d_rev = 0.0 if rev is None else np.nan_to_num(rev) * revenue
+    d_cogs = 0.0 if cogs is None or rev is None else np.nan_to_num(cogs) * revenue
+    d_ebit = d_rev - d_cogs
+
+    debt = sum(np.nan_to_num(b[k]) for k in ('Short-term Debt', 'Long-term Debt') if b.get(k) is not None)
+    if not debt and b.get('Total Liabilities') is not None:
+        debt = np.nan_to_num(b['Total Liabilities'])
+    d_int = np.asarray(rate_bp, dtype=float) / 10_000 * debt * floating_share
+
+    new_rev = None if rev is None else rev + d_rev
+    d_ar = 0.0 if new_rev is None else np.nan_to_num(new_rev) * np.asarray(ar_days, dtype=float) / 365
+    d_ni = d_ebit - d_int
+
+    out = dict(b)
+    out['Revenue'] = new_rev
+    out['COGS'] = _shift(cogs, d_cogs)
+    for k in ('EBIT', 'EBITDA'):
+        out[k] = _shift(b.get(k), d_ebit)
+    out['Net Income'] = _shift(b.get('Net Income'), d_ni)
+    out['CFO'] = _shift(b.get('CFO'), d_ni - d_ar)
+    out['Interest Expense'] = _add(b.get('Interest Expense'), d_int)
+    out['Interest Paid'] = _shift(b.get('Interest Paid'), d_int)
+    out['Accounts Receivable'] = _add(b.get('Accounts Receivable'), d_ar)
+    out['Cash'] = _shift(b.get('Cash'), d_ni - d_ar)
+    for k in ('Current Assets', 'Total Assets', 'Equity'):
+        out[k] = _shift(b.get(k), d_ni)
+    return out
+
+def stress_ratios(basics: Mapping, revenue=0.0, rate_bp=0.0, ar_days=0.0, floating_share: float = 1.0) -> Dict[str, np.ndarray]:
+    """compute_ratios for every scenario at once: {ratio: array over the broadcast shape of the shocks}.
+
+    Values are rounded like compute_ratios, so a zero shock reproduces compute_ratios(basics) exactly
+    (NaN where it gives None).
+    """
+    n = np.broadcast(np.asarray(revenue), np.asarray(rate_bp), np.asarray(ar_days)).size
+    stressed = stressed_basics(basics, np.broadcast_to(revenue, (n,)), rate_bp, ar_days, floating_share)
+    col = lambda k: None if stressed.get(k) is None else np.broadcast_to(np.asarray(stressed[k], dtype=float), (n,))
+    return {k: _round2(v) for k, v in _ratio_arrays(col, n).items()}
+
+def scenario_table(basics: Mapping, scenarios: Mapping[str, Mapping] = None, floating_share: float = 1.0) -> pd.DataFrame:
+    """Ratios under named deterministic scenarios (STRESS_SCENARIOS by default), with a Base row first."""
+    scenarios = {'Base': {}, **(STRESS_SCENARIOS if scenarios is None else scenarios)}
+    for spec in scenarios.values():
+        unknown = set(spec) - set(SHOCKS)
+        if unknown:
+            raise ValueError(f"unknown shocks {sorted(unknown)}; expected {list(SHOCKS)}")
+    shocks = {s: np.array([float(spec.get(s, 0.0)) for spec in scenarios.values()]) for s in SHOCKS}
+    ratios = stress_ratios(basics, floating_share=floating_share, **shocks)
+    return pd.DataFrame(ratios, index=pd.Index(list(scenarios), name="Scenario"), columns=RATIO_KEYS)
+
+def sample_shocks(spec: Mapping, n: int, seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Draws n scenarios per shock. Each shock in spec is a number (fixed) or a distribution:
+    {"dist": "normal", "mean", "sd"}, {"dist": "uniform", "low", "high"} or
+    {"dist": "triangular", "low", "mode", "high"}. Unlisted shocks are 0."""
+    unknown = set(spec) - set(SHOCKS)
+    if unknown:
+        raise ValueError(f"unknown shocks {sorted(unknown)}; expected {list(SHOCKS)}")
+    rng = np.random.default_rng(seed)
+    out = {}
+    for s in SHOCKS:
+        d = spec.get(s, 0.0)
+        if not isinstance(d, Mapping):
+            out[s] = np.full(n, float(d))
+            continue
+        kind = d.get("dist")
+        try:
+            if kind == "normal":
+                out[s] = rng.normal(d["mean"], d["sd"], n)
+            elif kind == "uniform":
+                out[s] = rng.uniform(d["low"], d["high"], n)
+            elif kind == "triangular":
+                # numpy rejects a zero-width triangle; it is just a fixed shock.
+                out[s] = (np.full(n, float(d["low"])) if d["low"] == d["high"] == d["mode"]
+                          else rng.triangular(d["low"], d["mode"], d["high"], n))
+            else:
+                raise ValueError(f"{s}: dist must be one of normal, uniform, triangular")
+        except KeyError as e:
+            raise ValueError(f"{s}: {kind} distribution needs {e.args[0]!r}") from None
+    return out
+
+def breach_probabilities(ratios: Mapping[str, np.ndarray], thresholds: Mapping = None) -> Dict:
+    thresholds = DECISION_THRESHOLDS if thresholds is None else thresholds
+    n = len(next(iter(ratios.values())))
+    out, any_breach = {}, np.zeros(n, dtype=bool)
+    for k, (side, limit) in thresholds.items():
+        v = ratios[k]
+        with np.errstate(invalid="ignore"):
+            # A negative leverage ratio means negative equity, which fails a ceiling too.
+            breach = ((v > limit) | (v < 0)) if side == "max" else v < limit
+        any_breach |= breach
+        out[k] = {"threshold": limit, "side": side, "probability": float(breach.mean()),
+                  "undefined": float(np.isnan(v).mean())}
+    return {"ratios": out, "any": float(any_breach.mean())}
+
+def distribution(values: np.ndarray, percentiles=STRESS_PERCENTILES) -> Dict:
+    ok = values[~np.isnan(values)]
+    if not len(ok):
+        return {"mean": None, "min": None, "max": None, **{f"p{p}": None for p in percentiles}}
+    qs = np.percentile(ok, percentiles)
+    return {"mean": round(float(ok.mean()), 2), "min": float(ok.min()), "max": float(ok.max()),
+            **{f"p{p}": round(float(q), 2) for p, q in zip(percentiles, qs)}}
+
+def monte_carlo(basics: Mapping, spec: Mapping, n: int = 10_000, seed: Optional[int] = None,
+                floating_share: float = 1.0, thresholds: Mapping = None) -> Dict:
+    """Distributions of every ratio and breach probabilities of the decision tests over n sampled scenarios."""
+    ratios = stress_ratios(basics, floating_share=floating_share, **sample_shocks(spec, n, seed))
+    return {"scenarios": n, "base": compute_ratios(basics),
+            "distributions": {k: distribution(v) for k, v in ratios.items()},
+            "breach": breach_probabilities(ratios, thresholds)}
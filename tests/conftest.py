@@ -0,0 +1,53 @@
+import math
+import os
+import random
+import sys
+import tempfile
+import pandas as pd
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+# Set before main/jobs are imported: no disk result cache, a private job directory, one worker each,
+# and no background preload racing the tests.
+os.environ["CLEARPASS_CACHE_PATH"] = ""
+os.environ.setdefault("CLEARPASS_JOB_DIR", tempfile.mkdtemp(prefix="clearpass-test-jobs-"))
+os.environ.setdefault("CLEARPASS_JOB_WORKERS", "1")
+os.environ.setdefault("CLEARPASS_WORKERS", "1")
+os.environ.setdefault("CLEARPASS_PRELOAD", "0")
+os.environ.pop("CLEARPASS_STORE_PATH", None)
+
+LONG = open(os.path.join(ROOT, "sample_public_company_long.csv"), "rb").read()
+WIDE = open(os.path.join(ROOT, "sample_public_company_wide.csv"), "rb").read()
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as c:
+        yield c
+
+# Random long-format statements for the equivalence tests.
+LABELS = ["Revenue", "Total revenue", "Net Sales", "Sales", "Cost of goods sold", "COGS", "Cost of revenue",
+          "Operating expenses", "SGA", "Operating income", "EBIT", "EBITDA", "Net income", "Net profit",
+          "Cash", "Cash and cash equivalents", "Accounts receivable", "Trade receivables", "Inventory",
+          "Accounts payable", "Short-term debt", "Long-term debt", "Total current assets", "Current liabilities",
+          "Total liabilities", "Total equity", "Shareholders' equity", "Total assets", "Interest expense",
+          "Finance costs", "Interest paid", "Net cash provided by operating activities", "Repayments of borrowings",
+          "Goodwill", "Deferred tax", "Other income", "Depreciation", "Share capital"]
+
+def noisy_label(rng: random.Random, label: str) -> str:
+    label = rng.choice([label, label.upper(), label.lower(), f"  {label}  ", label.replace(" ", "   ")])
+    return rng.choice([label, f"{label} (restated)", f"Total {label}", f"{label}\t"])
+
+def random_statement(rng: random.Random, rows: int) -> pd.DataFrame:
+    accounts = [noisy_label(rng, rng.choice(LABELS)) for _ in range(rows)]
+    values = [rng.choice([round(rng.uniform(-1e6, 1e6), 2), rng.randint(0, 10**7), f"{rng.randint(0, 10**6):,}",
+                          f"({rng.randint(1, 10**5)})", "", "n/a"]) for _ in range(rows)]
+    return pd.DataFrame({"Account": accounts, "Value": values})
+
+def same_value(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
@@ -0,0 +1,21 @@
+"""Smoke tests for the analysis endpoints through a local TestClient."""
+from conftest import LONG
+
+def test_analyze(client):
+    r = client.post("/analyze", files={"file": ("long.csv", LONG)})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["basics"]["Revenue"] > 0
+    assert body["ratios"]["Current Ratio"] == 2.0
+    assert body["unparseable"]["count"] == 0
+
+def test_analyze_pdf_page_hint(client):
+    from bench import synthetic_pdf
+    from pipeline import analyze_bytes
+    data = synthetic_pdf(4)
+    r = client.post("/analyze", params={"pages": "1"}, files={"file": ("s.pdf", data)})
+    assert r.status_code == 200
+    assert r.json()["basics"] == analyze_bytes("s.pdf", data, pdf_options={"pages": [1], "stop_when_found": False})["basics"]
+    assert r.json()["basics"] != client.post("/analyze", files={"file": ("s.pdf", data)}).json()["basics"]
+    assert client.post("/analyze", params={"pages": "x"}, files={"file": ("s.pdf", data)}).status_code == 422
+    assert client.post("/analyze/batch", params={"pages": "0"}, files=[("files", ("s.pdf", data))]).status_code == 422
@@ -0,0 +1,20 @@
+import io
+import zipfile
+from conftest import LONG, WIDE
+
+def test_analyze_batch(client):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("x/wide.csv", WIDE)
+        zf.writestr("bad.csv", b"\xff\x00garbage")
+    r = client.post("/analyze/batch", files=[("files", ("long.csv", LONG)), ("files", ("pack.zip", buf.getvalue()))])
+    assert r.status_code == 200
+    body = r.json()
+    assert body["count"] == 3 and body["failed"] == 1
+    assert [(x["file"], x["ok"]) for x in body["results"]] == [("long.csv", True), ("pack.zip/x/wide.csv", True), ("pack.zip/bad.csv", False)]
+    again = client.post("/analyze/batch", files=[("files", ("long.csv", LONG))]).json()
+    assert again["results"][0]["cached"] is True
+    assert again["results"][0]["ratios"] == body["results"][0]["ratios"]
+
+def test_analyze_batch_bad_zip(client):
+    assert client.post("/analyze/batch", files=[("files", ("pack.zip", b"not a zip"))]).status_code == 400
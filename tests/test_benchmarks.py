@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+from shared.parsing import BenchmarkStore, _naics_key
+
+def _store():
+    return BenchmarkStore(pd.DataFrame({
+        "naics": ["31", "311", "3118", "44", None],
+        "industry_name": ["Manufacturing", "Food Manufacturing", "Bakeries", "Retail", "Other"],
+        "current_ratio_median": [1.5, 1.6, 1.7, 1.2, 1.0],
+        "current_ratio_p25": [1.1, 1.2, 1.3, 0.9, 0.8],
+    }))
+
+@pytest.mark.parametrize("code, key", [(311, "311"), (311.0, "311"), ("311.0", "311"), (" 3118 ", "3118"),
+                                       ("31-1", "311"), (None, ""), (float("nan"), "")])
+def test_naics_key(code, key):
+    assert _naics_key(code) == key
+
+def test_longest_prefix_wins():
+    store = _store()
+    assert store.benchmark(naics="311811") == {"Current Ratio": 1.7}
+    assert store.benchmark(naics="311999") == {"Current Ratio": 1.6}
+    assert store.benchmark(naics="311.0") == {"Current Ratio": 1.6}
+    assert store.benchmark(naics=3199) == {"Current Ratio": 1.5}
+    assert store.percentiles(naics="4411") == {"Current Ratio": {"median": 1.2, "p25": 0.9}}
+    # NAICS first, then the name; a code nothing matches falls back to the name.
+    assert store.benchmark(naics="99", name="retail") == {"Current Ratio": 1.2}
+    with pytest.raises(KeyError):
+        store.row(naics="99")
+    frame = store.lookup_many(naics=["3118", "99", "44"])
+    assert frame["industry_name"].tolist()[::2] == ["Bakeries", "Retail"]
+    assert pd.isna(frame["industry_name"][1])
+
+def test_report_rejects_unknown_industry(client):
+    body = {"company": "Acme", "industry": "No Such Industry", "naics": "99", "basics": {"Revenue": 1.0}}
+    r = client.post("/report", json=body)
+    assert r.status_code == 422
+    assert "no benchmark" in r.json()["detail"]
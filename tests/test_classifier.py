@@ -0,0 +1,28 @@
+"""The compiled classifier must tag labels exactly as the per-pattern regex scan it replaced."""
+import random
+import re
+from shared.parsing import classifier_for, default_keywords, match_category
+from conftest import LABELS, noisy_label
+
+def _reference_tags(account_name, kw_map):
+    # match_category as it was before the compiled classifier: one re.search per pattern.
+    name = re.sub(r"\s+", " ", str(account_name).strip().lower())
+    return {k: any(re.search(p, name) for p in pats) for k, pats in kw_map.items()}
+
+def test_classifier_matches_reference_tags():
+    rng = random.Random(1)
+    kw = default_keywords()
+    clf = classifier_for(kw)
+    names = [noisy_label(rng, rng.choice(LABELS)) for _ in range(2000)]
+    matrix = clf.classify(names)
+    for name, row in zip(names, matrix):
+        expected = _reference_tags(name, kw)
+        assert match_category(name, kw) == expected
+        assert dict(zip(clf.categories, row.tolist())) == expected
+
+def test_aggregate_sums_every_matching_category():
+    clf = classifier_for(default_keywords())
+    totals = clf.aggregate(["Total revenue", "Net sales", "Cash and cash equivalents", "Goodwill"], [100.0, 50.0, 7.0, 1.0])
+    assert totals["revenue"] == 150.0 and totals["cash"] == 7.0
+    assert sum(totals.values()) == 157.0
+    assert classifier_for(default_keywords()) is clf
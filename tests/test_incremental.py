@@ -0,0 +1,42 @@
+import random
+import pandas as pd
+from shared.parsing import compute_ratios, default_keywords, parse_financials
+from incremental import IncrementalAnalysis
+from conftest import random_statement, same_value
+
+def test_incremental_matches_fresh_parse():
+    rng = random.Random(4)
+    inc = IncrementalAnalysis(default_keywords())
+    statements = {"a": random_statement(rng, 300), "b": random_statement(rng, 200)}
+    for name, df in statements.items():
+        inc.set_source(name, df)
+    for step in range(20):
+        name = rng.choice(list(statements))
+        df = statements[name].copy()
+        rows = rng.sample(range(len(df)), 10)
+        df.loc[rows, "Value"] = [rng.randint(-10**5, 10**5) for _ in rows]
+        df = pd.concat([df.drop(index=rng.sample(list(df.index), 5)), random_statement(rng, 5)], ignore_index=True)
+        statements[name] = df
+        inc.set_source(name, df)
+        if step == 10:
+            inc.remove_source("b")
+            del statements["b"]
+        basics, agg = parse_financials(pd.concat(list(statements.values()), ignore_index=True))
+        assert inc.agg == agg
+        assert all(same_value(inc.basics[k], basics[k]) for k in basics)
+        assert inc.ratios == compute_ratios(basics)
+
+def test_amendment_reports_only_what_moved():
+    inc = IncrementalAnalysis(default_keywords())
+    original = pd.DataFrame({"Account": ["Revenue", "Net income", "Total assets"], "Value": [1000, 100, 2000]})
+    inc.set_source("s", original)
+    amended = original.assign(Value=[1000, 150, 2000])
+    changes = inc.set_source("s", amended)
+    assert changes["categories"] == ["net_income"]
+    assert set(changes["ratios"]) == {"Profit Margin (%)", "Return on Assets (%)"}
+    assert changes["ratios"]["Profit Margin (%)"] == {"old": 10.0, "new": 15.0, "change": 5.0}
+    assert inc.set_source("s", amended)["categories"] == []
+    inc.rename_source("s", "s v2")
+    assert inc.set_source("s v2", amended)["categories"] == []
+    inc.remove_source("s v2")
+    assert inc.agg == parse_financials(original.iloc[:0])[1]
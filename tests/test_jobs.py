@@ -0,0 +1,38 @@
+import os
+import time
+from conftest import LONG, WIDE
+from jobs import JobQueue, RUNNING, CANCELLED
+
+def _wait(queue, job_id, until, timeout=120):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.get(job_id) if isinstance(queue, JobQueue) else queue.get(f"/jobs/{job_id}").json()
+        if until(job["status"]) or time.monotonic() > deadline:
+            return job
+        time.sleep(0.2)
+
+def test_jobs(client):
+    r = client.post("/jobs", files=[("files", ("long.csv", LONG)), ("files", ("wide.csv", WIDE))])
+    assert r.status_code == 202
+    job = _wait(client, r.json()["id"], lambda s: s not in ("queued", "running"))
+    assert job["status"] == "succeeded", job
+    assert job["progress"] == 1.0
+    assert [x["ok"] for x in job["result"]["results"]] == [True, True]
+    assert client.get("/jobs/not-a-job").status_code == 404
+
+def test_cancel_reaches_the_owning_process(tmp_path):
+    # Two queues on one store stand in for two server processes: one runs the job, the other cancels it.
+    owner = JobQueue(str(tmp_path), workers=1)
+    api = JobQueue(str(tmp_path), workers=0)
+    try:
+        job_dir = api.new_job_dir()
+        path = os.path.join(job_dir, "stuck.csv")
+        os.mkfifo(path)  # reading it blocks until the worker is killed
+        job_id = api.submit([{"name": "stuck.csv", "path": path, "digest": "0" * 64}])
+        assert _wait(api, job_id, lambda s: s == RUNNING)["status"] == RUNNING
+        assert api.cancel(job_id)["status"] == RUNNING
+        assert _wait(api, job_id, lambda s: s != RUNNING, timeout=30)["status"] == CANCELLED
+        assert not os.path.exists(job_dir)
+    finally:
+        owner.shutdown()
+        api.shutdown()
@@ -0,0 +1,48 @@
+import threading
+from shared.parsing import KeywordClassifier, LabelCache, default_keywords
+
+def test_lru_eviction_and_counters():
+    cache = LabelCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2, "maxsize": 2}
+    cache.resize(1)
+    assert len(cache) == 1 and cache.get("c") == 3
+    cache.clear()
+    assert cache.stats() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 1}
+    off = LabelCache(maxsize=0)
+    off.put("a", 1)
+    assert len(off) == 0
+
+def test_custom_keywords_do_not_share_entries():
+    cache = LabelCache()
+    stock = KeywordClassifier(default_keywords(), cache=cache)
+    kw = default_keywords()
+    kw["revenue"] = [r"\bturnover\b"]
+    custom = KeywordClassifier(kw, cache=cache)
+    assert stock.tag("Net Sales")["revenue"] is True
+    assert custom.tag("Net Sales")["revenue"] is False
+    assert stock.tag("Net Sales")["revenue"] is True
+    assert cache.stats()["hits"] == 1 and len(cache) == 2
+
+def test_cached_rows_are_read_only_and_thread_safe():
+    cache = LabelCache(maxsize=50)
+    clf = KeywordClassifier(cache=cache)
+    row = clf.tag_normalized("cash")
+    assert not row.flags.writeable
+    labels = [f"label {i}" for i in range(200)] + ["cash", "revenue"]
+    def work():
+        for _ in range(5):
+            clf.classify(labels)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache) == 50
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 1 + 4 * 5 * len(labels)
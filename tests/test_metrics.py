@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from conftest import LONG, ROOT
+from metrics import Registry, StageRecorder
+from shared.parsing import LabelCache, KeywordClassifier, set_stage_hook, reset_stage_hook
+
+def _series(text: str, name: str) -> float:
+    return sum(float(line.split()[-1]) for line in text.splitlines() if line.startswith(name + " "))
+
+def test_label_cache_counts_travel_in_the_breakdown():
+    clf = KeywordClassifier(cache=LabelCache())
+    recorder = StageRecorder()
+    token = set_stage_hook(recorder)
+    try:
+        clf.classify(["Revenue", "revenue ", "Cash"])
+        clf.classify(["Cash", "Inventory"])
+    finally:
+        reset_stage_hook(token)
+    breakdown = recorder.breakdown()
+    assert breakdown["label_cache"] == {"hits": 1, "misses": 3}
+    registry = Registry()
+    registry.ingest(breakdown)
+    text = registry.render()
+    assert _series(text, "clearpass_label_cache_hits_total") == 1
+    assert _series(text, "clearpass_label_cache_misses_total") == 3
+
+def test_analyze_reports_worker_cache_lookups(client):
+    import metrics
+    before = _series(metrics.REGISTRY.render(), "clearpass_label_cache_misses_total")
+    assert client.post("/analyze", files={"file": ("metrics.csv", LONG + b"\nUnseen label xyz,1\n")}).status_code == 200
+    assert _series(client.get("/metrics").text, "clearpass_label_cache_misses_total") > before
+
+def test_render_does_not_load_pandas():
+    code = "import sys, metrics; metrics.REGISTRY.render(); print('pandas' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+from shared.parsing import clean_values, find_number, normalize_numbers, set_stage_hook, reset_stage_hook
+from metrics import StageRecorder
+
+@pytest.mark.parametrize("cell, value", [
+    ("1234", 1234.0), ("1,234", 1234.0), ("1,234.56", 1234.56), (" 12.5 ", 12.5), (1234, 1234.0),
+    ("(1,234)", -1234.0), ("( 50 )", -50.0), ("-1,234", -1234.0), ("1,234-", -1234.0), ("−7", -7.0),
+    ("$1,234", 1234.0), ("€ 12", 12.0), ("(£1,000)", -1000.0), ("-$5", -5.0), ("USD 1,000", 1000.0), ("1,000 eur", 1000.0),
+    ("—", 0.0), ("-", 0.0), ("–", 0.0),
+    ("12k", 12_000.0), ("1.5m", 1_500_000.0), ("2bn", 2e9), ("3 MM", 3e6), ("(2.5k)", -2500.0), ("$1.2m", 1_200_000.0),
+    ("1'234", 1234.0), ("1 234", 1234.0),
+])
+def test_formats(cell, value):
+    out, bad = normalize_numbers([cell])
+    assert out[0] == value and not bad[0]
+
+def test_decimal_comma_and_auto():
+    cells = ["1.234,56", "1.234", "12,5", "(1.000,50)"]
+    out, bad = normalize_numbers(cells, decimal=",")
+    assert out.tolist() == [1234.56, 1234.0, 12.5, -1000.5] and not bad.any()
+    # auto: the rightmost mark is the decimal point when both appear; lone commas group thousands.
+    out, _ = normalize_numbers(cells, decimal="auto")
+    assert out.tolist() == [1234.56, 1.234, 125.0, -1000.5]
+    assert find_number("1.234,56", decimal=",") == 1234.56
+    with pytest.raises(ValueError):
+        normalize_numbers(cells, decimal=";")
+
+def test_scale_and_suffix_switch():
+    out, _ = normalize_numbers(["1,000", "(2)", 3.5], scale=1000)
+    assert out.tolist() == [1e6, -2000.0, 3500.0]
+    out, bad = normalize_numbers(["12k"], suffixes=False)
+    assert np.isnan(out[0]) and bad[0]
+
+def test_blanks_are_missing_and_garbage_is_flagged():
+    cells = ["", "n/a", None, np.nan, "NM", "abc", "1,2.3.4", "(12", "12)", "1,2,3.4.5"]
+    out, bad = normalize_numbers(cells)
+    assert np.isnan(out).all()
+    assert bad.tolist() == [False] * 5 + [True] * 5
+    numeric = pd.Series([1.0, np.nan, 3.0])
+    out, bad = normalize_numbers(numeric)
+    assert np.array_equal(out, numeric.to_numpy(), equal_nan=True) and not bad.any()
+
+def test_unparseable_cells_reach_the_stage_hook():
+    recorder = StageRecorder()
+    token = set_stage_hook(recorder)
+    try:
+        out = clean_values(pd.Series(["1", "oops", "(2)", "n/a"], index=[5, 6, 7, 8]))
+    finally:
+        reset_stage_hook(token)
+    assert out.index.tolist() == [5, 6, 7, 8]
+    assert out.tolist()[0] == 1.0 and out.tolist()[2] == -2.0
+    assert recorder.unparseable_report() == {"count": 1, "sample": ["oops"]}
@@ -0,0 +1,17 @@
+import io
+from bench import synthetic_pdf
+from parser_pdf import extract_tables_to_long
+
+def test_bytes_file_objects_and_workers_agree():
+    data = synthetic_pdf(6)
+    serial = extract_tables_to_long(io.BytesIO(data))
+    assert len(serial) > 0
+    assert extract_tables_to_long(data).equals(serial)
+    assert extract_tables_to_long(data, workers=2).equals(serial)
+    assert extract_tables_to_long(io.BytesIO(data), workers=2).equals(serial)
+
+def test_page_hint_limits_extraction():
+    data = synthetic_pdf(6)
+    first = extract_tables_to_long(data, pages="1")
+    assert 0 < len(first) < len(extract_tables_to_long(data))
+    assert extract_tables_to_long(data, pages=[1], workers=2).equals(first)
@@ -0,0 +1,23 @@
+import random
+import numpy as np
+import pandas as pd
+from shared.parsing import BASIC_KEYS, compute_ratios, compute_ratios_frame
+
+def test_compute_ratios_frame_matches_scalar():
+    rng = random.Random(2)
+    records = []
+    for _ in range(3000):
+        records.append({k: rng.choice([np.nan, 0.0, rng.uniform(-1e6, 1e6), float(rng.randint(1, 10**6))])
+                        for k in BASIC_KEYS})
+    frame = compute_ratios_frame(pd.DataFrame(records))
+    for basics, (_, row) in zip(records, frame.iterrows()):
+        expected = compute_ratios(basics)
+        got = {k: (None if pd.isna(v) else float(v)) for k, v in row.items()}
+        assert got == expected
+
+def test_compute_ratios_frame_keeps_the_index():
+    frame = pd.DataFrame({"Current Assets": [200.0, 0.0], "Current Liabilities": [100.0, 0.0]}, index=["a", "b"])
+    out = compute_ratios_frame(frame)
+    assert out.index.tolist() == ["a", "b"]
+    assert out.loc["a", "Current Ratio"] == 2.0 and np.isnan(out.loc["b", "Current Ratio"])
+    assert np.isnan(out["Debt-to-Equity"]).all()
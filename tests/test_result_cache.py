@@ -0,0 +1,23 @@
+import os
+import stat
+import tempfile
+import result_cache
+
+def _default(monkeypatch, tmp_path):
+    monkeypatch.delenv("CLEARPASS_CACHE_PATH", raising=False)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(result_cache, "_default", None)
+    return result_cache.default_cache()
+
+def test_disk_tier_defaults_to_a_private_directory(monkeypatch, tmp_path):
+    cache = _default(monkeypatch, tmp_path)
+    private = tmp_path / f"clearpass-{os.getuid()}"
+    assert stat.S_IMODE(os.stat(private).st_mode) == 0o700
+    assert [t.path for t in cache.tiers[1:]] == [str(private / "results.sqlite")]
+    cache.put("k", {"v": 1})
+    assert cache.get("k") == {"v": 1}
+
+def test_shared_directory_keeps_the_cache_in_memory(monkeypatch, tmp_path):
+    os.mkdir(tmp_path / f"clearpass-{os.getuid()}", 0o755)
+    os.chmod(tmp_path / f"clearpass-{os.getuid()}", 0o755)
+    assert len(_default(monkeypatch, tmp_path).tiers) == 1
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+import statement_store
+from statement_store import StatementStore, METRICS
+
+def _basics(x: float):
+    return {"Revenue": x, "Net Income": x / 10, "Current Ratio": None}
+
+def test_append_select_and_supersede(tmp_path):
+    s = StatementStore(str(tmp_path))
+    s.append_many([("b", 2023, _basics(1.0), {}), ("a", 2024, _basics(2.0), {}), ("a", 2023, _basics(3.0), {})])
+    s.append("a", 2024, _basics(4.0))
+    frame = s.frame()
+    assert list(frame.index) == [("a", 2023), ("a", 2024), ("b", 2023)]
+    assert frame["Revenue"].tolist() == [3.0, 4.0, 1.0]
+    assert np.isnan(frame["Current Ratio"]).all()
+    assert s.history("a")["Revenue"].tolist() == [3.0, 4.0]
+    assert s.frame(years=(2024, 2024))["Revenue"].tolist() == [4.0]
+    assert len(s.frame(["nobody"])) == 0
+
+def test_compact_gives_zero_copy_slices(tmp_path):
+    s = StatementStore(str(tmp_path))
+    for year in range(2020, 2024):
+        for b in ("c", "a", "b"):
+            s.append(b, year, _basics(float(year)))
+    s.append("a", 2021, _basics(0.0))
+    s.compact()
+    assert len(s) == 12 and s.generation == 1
+    values = s._state()[0]
+    hist = s.history("a")
+    assert hist.loc[2021, "Revenue"] == 0.0
+    assert np.shares_memory(hist.to_numpy(), values)
+    # Another instance follows the new generation.
+    assert StatementStore(str(tmp_path)).frame().equals(s.frame())
+
+def test_append_compacts_past_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(statement_store, "COMPACT_MIN_ROWS", 10)
+    s = StatementStore(str(tmp_path))
+    for i in range(10):
+        s.append(f"b{i % 3}", 2000 + i, _basics(float(i)))
+    assert s.generation == 1 and s.sorted_rows == 10
+
+def test_failed_append_leaves_store_untouched(tmp_path):
+    s = StatementStore(str(tmp_path))
+    s.append("a", 2024, _basics(1.0))
+    for bad in ([("c", 2024, _basics(1.0), {}), ("d\nx", 2024, _basics(1.0), {})],
+                [("c", 2024, _basics(1.0), {}), ("d", "not a year", _basics(1.0), {})],
+                [("c", 2024, {"Revenue": "lots"}, {})]):
+        with pytest.raises(ValueError):
+            s.append_many(bad)
+    assert s.borrowers == ["a"] and len(s) == 1
+    s.append("e", 2024, _basics(2.0))
+    fresh = StatementStore(str(tmp_path))
+    assert fresh.borrowers == ["a", "e"]
+    assert list(fresh.frame().index) == [("a", 2024), ("e", 2024)]
+
+def test_instances_share_borrower_ids(tmp_path):
+    one, two = StatementStore(str(tmp_path)), StatementStore(str(tmp_path))
+    one.append("x", 2024, _basics(1.0))
+    two.append("y", 2024, _basics(2.0))
+    one.append("y", 2023, _basics(3.0))
+    assert one.history("y")["Revenue"].tolist() == [3.0, 2.0]
+    assert StatementStore(str(tmp_path)).borrowers == ["x", "y"]
+
+def test_float32_and_format_check(tmp_path):
+    s = StatementStore(str(tmp_path), dtype="float32")
+    s.append("a", 2024, _basics(1.5))
+    assert StatementStore(str(tmp_path)).frame().dtypes.iloc[0] == np.float32
+    with pytest.raises(ValueError):
+        StatementStore(str(tmp_path / "bad"), dtype="int32")
+    assert METRICS[0] == "Revenue"
@@ -0,0 +1,49 @@
+import io
+import random
+import pandas as pd
+from openpyxl import Workbook
+from shared.parsing import parse_financials, parse_financials_stream
+from pipeline import iter_upload_chunks
+from conftest import random_statement, same_value
+
+def _xlsx(rows) -> bytes:
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def _cells(df: pd.DataFrame):
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+def test_stream_matches_whole_frame():
+    rng = random.Random(3)
+    df = random_statement(rng, 5000)
+    basics, agg = parse_financials(df)
+    for size in (1, 7, 1000, 5000):
+        s_basics, s_agg = parse_financials_stream(df.iloc[i:i + size] for i in range(0, len(df), size))
+        assert s_agg == agg
+        assert all(same_value(s_basics[k], basics[k]) for k in basics)
+
+def test_xlsx_chunks_match_read_excel():
+    sheets = [
+        # The value column has no header.
+        [("Account", None), ("Revenue", 100), ("Net income", 12)],
+        # A blank-headed column in the middle, a value past the last header and a trailing empty cell.
+        [("Account", None, "Value"), ("Revenue", None, 100), ("Cash", "note", 5, None, 7), ("EBIT", None, None, None)],
+        [("Account", "Value", None), ("Revenue", 100, None), ("Cash", 5)],
+    ]
+    for rows in sheets:
+        data = _xlsx(rows)
+        whole = pd.read_excel(io.BytesIO(data))
+        for size in (1, 2, 100):
+            chunks = list(iter_upload_chunks("ledger.xlsx", io.BytesIO(data), chunksize=size))
+            assert all(list(c.columns) == list(whole.columns) for c in chunks), (rows, whole.columns)
+            assert _cells(pd.concat(chunks, ignore_index=True)) == _cells(whole)
+        basics, agg = parse_financials(whole)
+        s_basics, s_agg = parse_financials_stream(iter_upload_chunks("ledger.xlsx", io.BytesIO(data), chunksize=1))
+        assert s_agg == agg
+        assert all(same_value(s_basics[k], basics[k]) for k in basics)
+    basics, _ = parse_financials_stream(iter_upload_chunks("ledger.xlsx", io.BytesIO(_xlsx(sheets[0]))))
+    assert basics["Revenue"] == 100.0
@@ -0,0 +1,23 @@
+import random
+import numpy as np
+from shared.parsing import BASIC_KEYS, compute_ratios
+from stress import monte_carlo, scenario_table, stress_ratios
+
+def test_zero_shock_matches_compute_ratios():
+    rng = random.Random(5)
+    for _ in range(500):
+        basics = {k: rng.choice([None, np.nan, 0.0, rng.uniform(-1e6, 1e6)]) for k in BASIC_KEYS if rng.random() < 0.9}
+        ratios = stress_ratios(basics, np.zeros(2))
+        assert {k: (None if np.isnan(v[0]) else float(v[0])) for k, v in ratios.items()} == compute_ratios(basics)
+
+def test_monte_carlo_base_agrees_with_zero_shock():
+    # A NaN Interest Paid leaves DSCR undefined rather than falling back to Interest Expense.
+    basics = {"Revenue": 1000.0, "EBIT": 200.0, "CFO": 150.0, "Interest Expense": 20.0, "Interest Paid": np.nan,
+              "Principal Repayment": 40.0, "Total Liabilities": 500.0, "Equity": 400.0}
+    mc = monte_carlo(basics, {"revenue": 0.0}, n=50, seed=0)
+    dscr = "DSCR (CFO / Debt Service)"
+    assert mc["base"][dscr] is None
+    assert mc["distributions"][dscr]["mean"] is None
+    assert mc["base"]["Debt-to-Equity"] == mc["distributions"]["Debt-to-Equity"]["mean"] == 1.25
+    table = scenario_table(basics, {"none": {}})
+    assert np.isnan(table.loc["none", dscr])